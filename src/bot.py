@@ -1,5 +1,6 @@
 import traceback
 import os
+from datetime import timedelta
 
 from discord import Activity, ActivityType, Embed, Option, Bot, Member, Intents, Guild, Message, VoiceState
 from discord.ext import commands
@@ -10,6 +11,7 @@ from src.lyrics.lyrics import Lyrics
 from src.player.player import Player
 from src.db.sqlite import Database
 from src.db.bot_sql import EVENT_TYPES
+from src.utils import parse_time
 
 class Bot(Bot):
 
@@ -29,6 +31,7 @@ class Bot(Bot):
         async def on_ready():
             self.logger.info("Bot conectado com o Discord.")
             self.db.check_guilds_and_users(self.guilds)
+            await self.player.on_ready()
             self.loop.create_task(
                 self.change_presence(activity=Activity(
                     type=ActivityType.listening, name="no /play, tchama ♫")))
@@ -109,6 +112,8 @@ class Bot(Bot):
 
         @self.event
         async def on_voice_state_update(member: Member, before: VoiceState, after: VoiceState):
+            if not member.bot and after.channel and before.channel != after.channel:
+                await self.player.on_voice_join(after.channel)
             if not member.bot:
                 event = None
                 if before.afk != after.afk:
@@ -172,7 +177,7 @@ class Bot(Bot):
                 Option(
                     str,
                     name="musica",
-                    description="Nome ou link do youtube.",
+                    description="Nome, link do youtube ou playlist/álbum do spotify.",
                     required=True,
                 )
             ],
@@ -267,6 +272,124 @@ class Bot(Bot):
                 )
                 await ctx.respond(embed=embed_msg, delete_after=5, ephemeral=True)
 
+        @self.command(
+            description="Ajusta o crossfade entre as músicas.",
+            options=[
+                Option(
+                    int,
+                    name="segundos",
+                    description="Duração do crossfade em segundos (0 desativa).",
+                    required=True,
+                )
+            ],
+        )
+        async def crossfade(ctx: commands.Context, seconds: int):
+            try:
+                seconds = await self.player.crossfade(ctx, seconds)
+                if seconds is None:
+                    message = "Nenhuma música reproduzindo."
+                else:
+                    message = f"Crossfade ajustado para {seconds}s."
+                await ctx.respond(message,
+                                  delete_after=self.delete_time,
+                                  ephemeral=True)
+            except Exception as err:
+                error = str(traceback.format_exc())
+                self.logger.error(error)
+                await self.send_exception(error, command="crossfade")
+                embed_msg = Embed(
+                    title="ERRO",
+                    description="Desculpe,\nTive um erro interno.",
+                    color=0xFF0000,
+                )
+                await ctx.respond(embed=embed_msg, delete_after=5, ephemeral=True)
+
+        @self.command(
+            description="Vai para uma posição da música atual.",
+            options=[
+                Option(
+                    str,
+                    name="tempo",
+                    description="Posição em segundos ou mm:ss.",
+                    required=True,
+                )
+            ],
+        )
+        async def seek(ctx: commands.Context, time: str):
+            try:
+                seconds = parse_time(time)
+                if seconds is None:
+                    await ctx.respond("Tempo inválido, use segundos ou mm:ss.",
+                                      delete_after=self.delete_time,
+                                      ephemeral=True)
+                    return
+                position = await self.player.seek(ctx, seconds)
+                await self.respond_seek(ctx, position)
+            except Exception as err:
+                error = str(traceback.format_exc())
+                self.logger.error(error)
+                await self.send_exception(error, command="seek")
+                embed_msg = Embed(
+                    title="ERRO",
+                    description="Desculpe,\nTive um erro interno.",
+                    color=0xFF0000,
+                )
+                await ctx.respond(embed=embed_msg, delete_after=5, ephemeral=True)
+
+        @self.command(
+            description="Avança a música atual.",
+            options=[
+                Option(
+                    int,
+                    name="segundos",
+                    description="Quantidade de segundos (padrão 10).",
+                    required=False,
+                    default=10,
+                )
+            ],
+        )
+        async def forward(ctx: commands.Context, seconds: int):
+            try:
+                position = await self.player.forward(ctx, seconds)
+                await self.respond_seek(ctx, position)
+            except Exception as err:
+                error = str(traceback.format_exc())
+                self.logger.error(error)
+                await self.send_exception(error, command="forward")
+                embed_msg = Embed(
+                    title="ERRO",
+                    description="Desculpe,\nTive um erro interno.",
+                    color=0xFF0000,
+                )
+                await ctx.respond(embed=embed_msg, delete_after=5, ephemeral=True)
+
+        @self.command(
+            description="Volta a música atual.",
+            options=[
+                Option(
+                    int,
+                    name="segundos",
+                    description="Quantidade de segundos (padrão 10).",
+                    required=False,
+                    default=10,
+                )
+            ],
+        )
+        async def rewind(ctx: commands.Context, seconds: int):
+            try:
+                position = await self.player.rewind(ctx, seconds)
+                await self.respond_seek(ctx, position)
+            except Exception as err:
+                error = str(traceback.format_exc())
+                self.logger.error(error)
+                await self.send_exception(error, command="rewind")
+                embed_msg = Embed(
+                    title="ERRO",
+                    description="Desculpe,\nTive um erro interno.",
+                    color=0xFF0000,
+                )
+                await ctx.respond(embed=embed_msg, delete_after=5, ephemeral=True)
+
         @self.command(description="Mostra a fila de reprodução.")
         async def list(ctx: commands.Context):
             try:
@@ -308,6 +431,46 @@ class Bot(Bot):
                 )
                 await ctx.respond(embed=embed_msg, delete_after=5, ephemeral=True)
 
+        @self.command(
+            description="Mover música para outra posição da fila.",
+            options=[
+                Option(
+                    int,
+                    name="de",
+                    description="Posição atual da música na fila.",
+                    required=True,
+                ),
+                Option(
+                    int,
+                    name="para",
+                    description="Nova posição da música na fila.",
+                    required=True,
+                ),
+            ],
+        )
+        async def move(ctx: commands.Context, src: int, dst: int):
+            try:
+                if await self.player.move(ctx, src, dst):
+                    await ctx.respond(embed=Embed(
+                                          title=f":arrow_up_down: **Música movida na fila**",
+                                          color=0x169CCC),
+                                      delete_after=self.delete_time)
+                else:
+                    await ctx.respond(embed=Embed(
+                                          title=f":x: **Posição inválida**",
+                                          color=0xEB2828),
+                                      delete_after=self.delete_time)
+            except Exception as err:
+                error = str(traceback.format_exc())
+                self.logger.error(error)
+                await self.send_exception(error, command="move")
+                embed_msg = Embed(
+                    title="ERRO",
+                    description="Desculpe,\nTive um erro interno.",
+                    color=0xFF0000,
+                )
+                await ctx.respond(embed=embed_msg, delete_after=5, ephemeral=True)
+
         @self.command(description="Limpa a fila de reprodução.")
         async def clear(ctx: commands.Context):
             try:
@@ -395,9 +558,14 @@ class Bot(Bot):
 
         self.run(self.token)
 
+    async def close(self) -> None:
+        await super().close()
+        await self.player.close()
+
     async def send_commands_list(self, ctx: commands.Context):
         command_list_msg_title = "🎶 **Lista de comandos**"
         commands_list_msg_description = "**/play** <nome da música> - Coloca uma música solicitada na fila\n\
+                **/play** <playlist ou álbum do spotify> - Coloca as músicas da playlist na fila\n\
                 **/pause** -  Pausa a música atual\n\
                 **/resume** - Voltar a tocar a música pausada\n\
                 **/next** - Pula para a proxima música na fila\n\
@@ -405,6 +573,11 @@ class Bot(Bot):
                 **/shuffle** - Embaralha a fila de músicas a serem tocadas\n\
                 **/clear** - Limpa a fila de músicas\n\
                 **/remove** <posição da música na fila>  - Remove uma música da fila\n\
+                **/move** <de> <para> - Move uma música para outra posição da fila\n\
+                **/crossfade** <segundos> - Ajusta o crossfade entre as músicas\n\
+                **/seek** <tempo> - Vai para uma posição da música atual\n\
+                **/forward** <segundos> - Avança a música atual\n\
+                **/rewind** <segundos> - Volta a música atual\n\
                 **/lyrics** - Exibi a letra da música que está reproduzindo\n\
                 **/lyrics** <nome da música> - Exibi a letra da música solicitada\n\
                 **/leave** - Me manda embora 😔\n\
@@ -418,6 +591,13 @@ class Bot(Bot):
         commands_list_embed_msg.set_footer(text=f"Versão {self.__version__}")
         await ctx.send(embed=commands_list_embed_msg, ephemeral=True)
 
+    async def respond_seek(self, ctx: commands.Context, position: int) -> None:
+        if position is None:
+            message = "Nenhuma música reproduzindo."
+        else:
+            message = f"Música posicionada em {timedelta(seconds=position)}."
+        await ctx.respond(message, delete_after=self.delete_time, ephemeral=True)
+
     async def send_exception(self,
                              exception: str,
                              command: str = None) -> None:
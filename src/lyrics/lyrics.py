@@ -93,7 +93,10 @@ class Lyrics():
         """
         Send lyrics from the player current song.
         """
-        current_song = self.player.current_song[ctx.guild.id]
+        session = self.player.find_session(ctx)
+        current_song = session.current_song if session else None
+        if not current_song:
+            return
         if current_song.track:
             song_title = current_song.track
         else:
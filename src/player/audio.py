@@ -0,0 +1,184 @@
+from bisect import bisect_right
+from json import dumps, load, loads
+from os import path, remove, rename, replace
+import struct
+import subprocess
+
+from discord import AudioSource
+from discord.oggparse import OggStream
+
+
+MAX_GAIN = 20.0
+MIN_GAIN = 0.5
+SAMPLE_RATE = 48000
+SEEK_INDEX_INTERVAL = 5
+OGG_PAGE_HEADER = struct.Struct('<4sBBqIIIB')
+OPUS_HEADERS = (b'OpusHead', b'OpusTags')
+
+
+def get_opus_path(song_path: str) -> str:
+    return song_path.rsplit('.', 1)[0] + '.opus'
+
+
+def get_index_path(song_path: str) -> str:
+    return song_path.rsplit('.', 1)[0] + '.idx'
+
+
+def build_seek_index(opus_path: str) -> str:
+    """
+        Scan the Ogg pages of an opus rendition and store the start time
+        and byte offset of a page every few seconds
+        Return the path of the index
+    """
+    index = []
+    pre_skip = 0
+    last_granule = 0
+    next_time = 0
+    offset = 0
+    with open(opus_path, 'rb') as data:
+        while True:
+            header = data.read(OGG_PAGE_HEADER.size)
+            if len(header) < OGG_PAGE_HEADER.size:
+                break
+            capture, _, flags, granule, _, _, _, segments = OGG_PAGE_HEADER.unpack(header)
+            if capture != b'OggS':
+                break
+            body_size = sum(data.read(segments))
+            body = data.read(body_size) if offset == 0 else None
+            if body is None:
+                data.seek(body_size, 1)
+            elif body.startswith(b'OpusHead'):
+                pre_skip = struct.unpack('<H', body[10:12])[0]
+
+            if granule > 0:
+                start = max(last_granule - pre_skip, 0) / SAMPLE_RATE
+                if not flags & 1 and start >= next_time:
+                    index.append([round(start, 3), offset])
+                    next_time = start + SEEK_INDEX_INTERVAL
+                last_granule = granule
+            offset += OGG_PAGE_HEADER.size + segments + body_size
+
+    index_path = get_index_path(opus_path)
+    with open(f'{index_path}.part', 'w') as out:
+        out.write(dumps(index, separators=(',', ':')))
+    replace(f'{index_path}.part', index_path)
+    return index_path
+
+
+def load_seek_index(opus_path: str) -> list:
+    try:
+        with open(get_index_path(opus_path), 'r') as data:
+            return load(data)
+    except (FileNotFoundError, ValueError):
+        return []
+
+
+def packet_duration(packet: bytes) -> float:
+    """
+        Duration in seconds of an opus packet, read from its TOC byte
+    """
+    toc = packet[0]
+    config = toc >> 3
+    if config < 12:
+        frame = (10, 20, 40, 60)[config % 4]
+    elif config < 16:
+        frame = (10, 20)[config % 2]
+    else:
+        frame = (2.5, 5, 10, 20)[config % 4]
+    count = toc & 3
+    frames = 1 if count == 0 else 2 if count < 3 else packet[1] & 0x3F
+    return frame * frames / 1000
+
+
+class OpusFileAudio(AudioSource):
+    """
+    Reads the packets of an Ogg/Opus rendition straight from disk,
+    starting from the indexed page closest to the offset
+    """
+
+    def __init__(self, opus_path: str, offset: float = 0) -> None:
+        self.file = open(opus_path, 'rb')
+        index = load_seek_index(opus_path)
+        start_time, start_byte = 0, 0
+        pos = bisect_right([time for time, _ in index], offset)
+        if pos:
+            start_time, start_byte = index[pos - 1]
+        self.file.seek(start_byte)
+        self.packets = OggStream(self.file).iter_packets()
+
+        skip = offset - start_time
+        while skip > 1e-6:
+            packet = self.read()
+            if not packet:
+                break
+            skip -= packet_duration(packet)
+
+    def read(self) -> bytes:
+        packet = next(self.packets, b'')
+        while packet.startswith(OPUS_HEADERS):
+            packet = next(self.packets, b'')
+        return packet
+
+    def is_opus(self) -> bool:
+        return True
+
+    def cleanup(self) -> None:
+        self.file.close()
+
+
+def analyze_loudness(song_path: str, target: float) -> float:
+    """
+        Measure the integrated loudness (EBU R128) of a file
+        Return the gain in dB to reach the target loudness
+    """
+    result = subprocess.run(
+        ['ffmpeg', '-hide_banner', '-nostats', '-i', song_path, '-vn', '-af',
+         f'loudnorm=I={target}:TP=-1.5:LRA=11:print_format=json', '-f',
+         'null', '-'],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE)
+    output = result.stderr.decode(errors='ignore')
+    try:
+        stats = loads(output[output.rindex('{'):output.rindex('}') + 1])
+        gain = target - float(stats['input_i'])
+        return round(max(-MAX_GAIN, min(MAX_GAIN, gain)), 2)
+    except ValueError:
+        print(f'[ERROR] - Failed to analyze loudness: {song_path}\n Err:{output}')
+        return 0.0
+
+
+def make_opus_rendition(song_path: str, gain: float = None) -> str:
+    """
+        Remux the downloaded media into an Ogg/Opus file,
+        transcoding only when the source codec is not opus
+        or when a loudness gain must be applied
+        Return the path of the rendition
+    """
+    opus_path = get_opus_path(song_path)
+    if path.exists(opus_path):
+        return opus_path
+
+    tmp_path = f'{opus_path}.part'
+    base_args = ['ffmpeg', '-y', '-loglevel', 'error', '-i', song_path,
+                 '-vn', '-map_metadata', '-1']
+    encode_args = ['-c:a', 'libopus', '-b:a', '128k', '-ar', '48000', '-ac', '2']
+    if gain and abs(gain) >= MIN_GAIN:
+        audio_filter = f'volume={gain}dB'
+        if gain > 0:
+            audio_filter += ',alimiter=limit=0.95'
+        codecs = [['-af', audio_filter] + encode_args]
+    else:
+        codecs = [['-c:a', 'copy'], encode_args]
+    for codec_args in codecs:
+        result = subprocess.run(base_args + codec_args + ['-f', 'ogg', tmp_path],
+                                stdout=subprocess.DEVNULL,
+                                stderr=subprocess.PIPE)
+        if result.returncode == 0:
+            rename(tmp_path, opus_path)
+            return opus_path
+
+    if path.exists(tmp_path):
+        remove(tmp_path)
+    print(f'[ERROR] - Failed to create opus rendition: {song_path}\n'
+          f' Err:{result.stderr.decode(errors="ignore")}')
+    return None
@@ -0,0 +1,101 @@
+from asyncio import sleep
+from datetime import date, datetime
+from os import getenv
+
+from src.logger import Logger
+from src.player.prefetcher import Prefetcher
+from src.player.songcache import SongCache
+
+
+class Evictor():
+    """
+    Background job that keeps the songs folder inside the entry
+    and byte budgets, removing the least valuable songs first.
+    Songs playing, queued or being downloaded in any guild,
+    or waiting on a journaled session to be restored, are never removed.
+    """
+
+    def __init__(self, logger: Logger, cache: SongCache,
+                 prefetcher: Prefetcher, sessions: dict,
+                 restores: dict) -> None:
+        self.logger = logger
+        self.cache = cache
+        self.prefetcher = prefetcher
+        self.sessions = sessions
+        self.restores = restores
+        self.MAX_SIZE = int(getenv('MAX_CACHE_SIZE', 100))
+        self.MAX_BYTES = int(getenv('MAX_CACHE_BYTES', 0))
+        self.INTERVAL = int(getenv('EVICTION_INTERVAL', 600))
+
+    async def run(self) -> None:
+        while True:
+            try:
+                self.evict()
+            except Exception as e:
+                self.logger.error(f'Erro ao liberar espaco do cache [{e}]')
+            await sleep(self.INTERVAL)
+
+    def has_room(self) -> bool:
+        """
+        Checks if one more song fits the entry and byte budgets
+        """
+        if self.MAX_SIZE and self.cache.queue_size() >= self.MAX_SIZE:
+            return False
+        if self.MAX_BYTES:
+            return sum(entry.size for entry in self.cache.entries()) < self.MAX_BYTES
+        return True
+
+    def protected(self) -> set:
+        """
+        Ids of the songs in use by any guild
+        """
+        ids = set(self.prefetcher.downloads)
+        for pinned in self.cache.pins.values():
+            ids.update(pinned)
+        for session in self.sessions.values():
+            ids.update(entry.id for entry in session.queue)
+            if session.current_entry:
+                ids.add(session.current_entry.id)
+            if session.source and session.source.next_entry:
+                ids.add(session.source.next_entry.id)
+        for snapshot in self.restores.values():
+            ids.update(song_id for song_id, _ in snapshot['queue'])
+            if 'current' in snapshot:
+                ids.add(snapshot['current'][0])
+        return ids
+
+    def score(self, times_played: int, last_played: str, size: int) -> float:
+        """
+        Value of keeping a song per megabyte: frequently
+        and recently played songs score higher, big files lower
+        """
+        try:
+            age = (date.today() - datetime.strptime(last_played, '%Y-%m-%d').date()).days
+        except (TypeError, ValueError):
+            age = 365
+        return (times_played + 1) / (1 + max(age, 0)) / (1 + size / 2**20)
+
+    def evict(self) -> None:
+        songs = self.cache.entries()
+        entries = len(songs)
+        total = sum(song.size for song in songs)
+        if (not self.MAX_SIZE or entries <= self.MAX_SIZE) and \
+                (not self.MAX_BYTES or total <= self.MAX_BYTES):
+            return
+
+        protected = self.protected()
+        songs.sort(key=lambda song: self.score(song.times_played,
+                                               song.last_played, song.size))
+        removed = 0
+        for song in songs:
+            if (not self.MAX_SIZE or entries <= self.MAX_SIZE) and \
+                    (not self.MAX_BYTES or total <= self.MAX_BYTES):
+                break
+            if song.id in protected:
+                continue
+            self.cache.remove_song(song.id)
+            entries -= 1
+            total -= song.size
+            removed += 1
+        self.logger.info(
+            f'{removed} musicas removidas do cache, {entries} restantes ({total // 2**20} MB).')
@@ -0,0 +1,111 @@
+import codecs
+from os import getenv
+from re import compile
+
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
+
+from src.logger import Logger
+
+
+class HttpClient():
+    """
+    Keep-alive HTTP client shared by all the scraping of the player,
+    with a bounded connection pool, a limit of connections per host,
+    timeouts and pages parsed while they are streamed.
+    """
+
+    CHUNK_SIZE = 16384
+    OVERLAP = 1024
+
+    def __init__(self, logger: Logger) -> None:
+        self.logger = logger
+        self.POOL_SIZE = int(getenv('HTTP_POOL_SIZE', 20))
+        self.HOST_LIMIT = int(getenv('HTTP_HOST_LIMIT', 4))
+        self.TIMEOUT = float(getenv('HTTP_TIMEOUT', 10))
+        self.session: ClientSession = None
+
+    def get_session(self) -> ClientSession:
+        """
+        Creates the session on first use, inside the running event loop
+        """
+        if not self.session or self.session.closed:
+            connector = TCPConnector(limit=self.POOL_SIZE,
+                                     limit_per_host=self.HOST_LIMIT,
+                                     ttl_dns_cache=300)
+            self.session = ClientSession(
+                connector=connector,
+                timeout=ClientTimeout(total=self.TIMEOUT),
+                headers={'Accept-Encoding': 'gzip, deflate',
+                         'Accept-Language': 'en-US,en;q=0.9'})
+        return self.session
+
+    async def get_text(self, url: str, **kwargs) -> str:
+        async with self.get_session().get(url, **kwargs) as response:
+            response.raise_for_status()
+            return await response.text()
+
+    async def get_json(self, url: str, method: str = 'GET', **kwargs):
+        async with self.get_session().request(method, url, **kwargs) as response:
+            response.raise_for_status()
+            return await response.json(content_type=None)
+
+    async def scan(self, url: str, pattern: str, limit: int = None) -> list:
+        """
+        Streams a page and returns the first group of every match
+        of the pattern, stops downloading once the limit is reached
+        """
+        matches = []
+        found = self.iter_matches(url, pattern)
+        try:
+            async for match in found:
+                matches.append(match.group(1))
+                if limit and len(matches) >= limit:
+                    break
+        finally:
+            await found.aclose()
+        return matches
+
+    async def iter_matches(self, url: str, pattern: str, method: str = 'GET',
+                           **kwargs):
+        """
+        Yields the matches of the pattern while the response is streamed,
+        closing it early if the caller stops iterating
+        """
+        regex = compile(pattern)
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+        buffer = ''
+        async with self.get_session().request(method, url, **kwargs) as response:
+            response.raise_for_status()
+            finished = False
+            try:
+                while not finished:
+                    chunk = await response.content.read(self.CHUNK_SIZE)
+                    finished = not chunk
+                    buffer += decoder.decode(chunk, final=finished)
+                    safe_end = len(buffer) if finished else len(buffer) - self.OVERLAP
+                    cut = max(safe_end, 0)
+                    for match in regex.finditer(buffer):
+                        if match.end() > safe_end:
+                            cut = min(cut, match.start())
+                            break
+                        cut = max(cut, match.end())
+                        yield match
+                    buffer = buffer[cut:]
+            finally:
+                if not finished:
+                    await self.stop(response)
+
+    async def stop(self, response) -> None:
+        """
+        Stops reading a response: drops the connection while the body
+        is still arriving, otherwise consumes what is already buffered
+        so the pooled connection is left clean
+        """
+        if response.connection:
+            response.close()
+        else:
+            await response.read()
+
+    async def close(self) -> None:
+        if self.session and not self.session.closed:
+            await self.session.close()
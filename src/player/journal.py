@@ -0,0 +1,92 @@
+from asyncio import sleep
+from json import dumps, load
+from os import getenv, listdir, makedirs, path, remove, replace
+
+from src.logger import Logger
+from src.player.session import GuildSession
+
+
+class Journal():
+    """
+    Keeps a compact snapshot of every active guild session on disk
+    (song ids, requester ids and playback offset)
+    so the queues survive a restart of the bot.
+    """
+
+    def __init__(self, logger: Logger) -> None:
+        self.logger = logger
+        self.journal_path = 'cfg/sessions'
+        self.INTERVAL = int(getenv('JOURNAL_INTERVAL', 5))
+        self.OFFSET_INTERVAL = int(getenv('JOURNAL_OFFSET_INTERVAL', 30))
+        self.dirty = set()
+        makedirs(self.journal_path, exist_ok=True)
+
+    def mark(self, session: GuildSession) -> None:
+        """
+        Schedules the session snapshot to be written on the next flush
+        """
+        self.dirty.add(session.guild_id)
+
+    def snapshot(self, session: GuildSession) -> dict:
+        output = {}
+        output['voice'] = session.voice_client.channel.id
+        output['text'] = session.text_channel.id
+        if session.current_entry:
+            output['current'] = [session.current_entry.id,
+                                 self.requester_id(session.current_entry),
+                                 int(session.source.position() if session.source else 0)]
+        output['queue'] = [[entry.id, self.requester_id(entry)]
+                           for entry in session.queue]
+        return output
+
+    def requester_id(self, entry) -> int:
+        return entry.requester.id if entry.requester else None
+
+    def save(self, session: GuildSession) -> None:
+        file_path = f'{self.journal_path}/{session.guild_id}.json'
+        try:
+            with open(f'{file_path}.tmp', 'w') as out:
+                out.write(dumps(self.snapshot(session), separators=(',', ':')))
+            replace(f'{file_path}.tmp', file_path)
+        except Exception as e:
+            self.logger.error(f'Erro ao salvar sessao {session.guild_id} [{e}]')
+
+    def delete(self, guild_id: int) -> None:
+        self.dirty.discard(guild_id)
+        file_path = f'{self.journal_path}/{guild_id}.json'
+        if path.exists(file_path):
+            remove(file_path)
+
+    def load(self) -> dict:
+        """
+        Returns the snapshots left on disk by guild id
+        """
+        snapshots = {}
+        for f in listdir(self.journal_path):
+            if not f.endswith('.json'):
+                continue
+            try:
+                with open(f'{self.journal_path}/{f}', 'r') as data:
+                    snapshots[int(f[:-len('.json')])] = load(data)
+            except Exception as e:
+                self.logger.error(f'Erro ao carregar sessao {f} [{e}]')
+        return snapshots
+
+    async def run(self, sessions: dict) -> None:
+        """
+        Writes the changed sessions every interval
+        and the offsets of the playing ones less often
+        """
+        ticks = 0
+        while True:
+            await sleep(self.INTERVAL)
+            ticks += self.INTERVAL
+            if ticks >= self.OFFSET_INTERVAL:
+                ticks = 0
+                self.dirty.update(guild_id for guild_id, session in sessions.items()
+                                  if session.current_entry)
+            dirty, self.dirty = self.dirty, set()
+            for guild_id in dirty:
+                session = sessions.get(guild_id)
+                if session and session.voice_client and session.text_channel:
+                    self.save(session)
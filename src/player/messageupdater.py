@@ -0,0 +1,55 @@
+from asyncio import Task, create_task, get_running_loop, sleep
+
+from discord import HTTPException, Message
+
+from src.logger import Logger
+
+
+class MessageUpdater():
+    """
+    Coalesces the edits of a message. Pending embed and view changes
+    are merged into a single edit, sent at most once per interval,
+    and intermediate states are dropped when a newer one arrives.
+    """
+
+    def __init__(self, message: Message, logger: Logger,
+                 interval: float) -> None:
+        self.message = message
+        self.logger = logger
+        self.interval = interval
+        self.pending = {}
+        self.next_edit = 0
+        self.task: Task = None
+
+    def update(self, **changes) -> None:
+        """
+        Schedules an edit with the given message fields
+        """
+        self.pending.update(changes)
+        if not self.task or self.task.done():
+            self.task = create_task(self.flush())
+
+    async def flush(self) -> None:
+        loop = get_running_loop()
+        while self.pending:
+            delay = self.next_edit - loop.time()
+            if delay > 0:
+                await sleep(delay)
+
+            changes, self.pending = self.pending, {}
+            try:
+                self.message = await self.message.edit(**changes)
+                self.next_edit = loop.time() + self.interval
+            except HTTPException as err:
+                if err.status != 429:
+                    self.logger.error(f'Falha ao editar mensagem do player [{err}]')
+                    continue
+                retry_after = float(err.response.headers.get('Retry-After', 5))
+                self.logger.warning(
+                    f'Rate limit ao editar mensagem do player, aguardando {retry_after}s.')
+                self.pending = {**changes, **self.pending}
+                self.next_edit = loop.time() + retry_after
+
+    def close(self) -> None:
+        if self.task:
+            self.task.cancel()
@@ -0,0 +1,60 @@
+from os import path, remove
+
+from src.logger import Logger
+from src.player.audio import (
+    analyze_loudness,
+    build_seek_index,
+    make_opus_rendition,
+)
+from src.player.prefetcher import Prefetcher
+from src.player.songcache import SongCache
+from src.player.worker import Worker
+
+
+class Normalizer():
+    """
+    Background job that measures the loudness of cached songs
+    downloaded before the analysis existed
+    """
+
+    BACKGROUND_GUILD = 0
+
+    def __init__(self, logger: Logger, cache: SongCache, worker: Worker,
+                 prefetcher: Prefetcher) -> None:
+        self.logger = logger
+        self.cache = cache
+        self.worker = worker
+        self.prefetcher = prefetcher
+
+    async def run(self) -> None:
+        ids = self.cache.unmeasured()
+        if not ids:
+            return
+        self.logger.info(f'Analisando volume de {len(ids)} musicas do cache.')
+
+        for id in ids:
+            if id in self.prefetcher.downloads:
+                continue
+            song = self.cache.get_song(id)
+            if not song or song.loudness_gain is not None \
+                    or not path.exists(song.path):
+                continue
+            try:
+                song.loudness_gain = await self.worker.run(
+                    self.BACKGROUND_GUILD, analyze_loudness, song.path,
+                    self.prefetcher.LOUDNESS_TARGET, background=True)
+                if song.opus_path and path.exists(song.opus_path):
+                    remove(song.opus_path)
+                    song.opus_path = await self.worker.run(
+                        self.BACKGROUND_GUILD, make_opus_rendition, song.path,
+                        song.loudness_gain, background=True)
+                    if song.opus_path:
+                        await self.worker.run(self.BACKGROUND_GUILD,
+                                              build_seek_index, song.opus_path,
+                                              background=True)
+            except Exception as e:
+                self.logger.error(f'Erro ao analisar volume da musica {id} [{e}]')
+                continue
+            if self.cache.has_song(id):
+                self.cache.add_song(song)
+        self.logger.info('Analise de volume do cache concluida.')
@@ -1,35 +1,169 @@
-from asyncio import sleep
+from asyncio import CancelledError, Event, Queue, Semaphore, TimeoutError, wait_for
 from datetime import timedelta
-from os import getenv
-from queue import Queue
-from random import shuffle
+from math import ceil
+from os import getenv, path
 from re import match, search
 import traceback
+from weakref import WeakValueDictionary
 
-from discord import Embed, FFmpegPCMAudio
+from discord import (
+    AudioSource,
+    Embed,
+    FFmpegOpusAudio,
+    FFmpegPCMAudio,
+    PCMVolumeTransformer,
+)
 from discord.ext.commands import Context
 from discord.ui import Button, View, Modal, InputText
 from discord import ButtonStyle, Interaction
+from src.player.audio import OpusFileAudio
+from src.player.evictor import Evictor
+from src.player.http import HttpClient
+from src.player.journal import Journal
+from src.player.messageupdater import MessageUpdater
+from src.player.normalizer import Normalizer
+from src.player.prefetcher import Prefetcher
+from src.player.querycache import QueryCache
+from src.player.queueentry import QueueEntry
+from src.player.queuesource import QueueSource
+from src.player.session import GuildSession
+from src.player.singleflight import SingleFlight
+from src.player.song import Song
+from src.player.spotify import SPOTIFY_COLLECTION, Spotify
 from src.player.songcache import SongCache
+from src.player.songqueue import SongQueue
+from src.player.warmer import Warmer
+from src.player.worker import Worker
 from src.db.bot_sql import EVENT_TYPES
 from src.player.youtube import (
     download_song,
+    get_song_info,
     get_song_url,
-    get_youtube_playlist_songlist,
+    get_song_youtube_url,
+    is_stream_expired,
+    iter_youtube_playlist,
 )
 
 
 class Player:
 
     def __init__(self, bot) -> None:
-        self.song_queue = {}
-        self.current_song = {}
+        self.sessions = {}
         self.bot = bot
         self.logger = bot.logger
         self.cache = SongCache(self.logger)
+        self.queries = QueryCache(self.logger)
+        self.http = HttpClient(self.logger)
+        self.spotify = Spotify(self.logger, self.http)
+        self.worker = Worker(self.logger)
+        self.flights = SingleFlight()
+        # Songs resolved but not on the cache yet, while something queues them
+        self.resolved = WeakValueDictionary()
+        self.prefetcher = Prefetcher(self.logger, self.cache, self.worker,
+                                     self.resolve_pending)
+        self.normalizer = Normalizer(self.logger, self.cache, self.worker,
+                                     self.prefetcher)
+        self.pending_restores = {}
+        self.evictor = Evictor(self.logger, self.cache, self.prefetcher,
+                               self.sessions, self.pending_restores)
+        self.warmer = Warmer(self.logger, self.bot, self.cache, self.worker,
+                             self.prefetcher, self.evictor)
+        self.journal = Journal(self.logger)
+        self.background_started = False
         self.IDLE_TIMEOUT = int(getenv("IDLE_TIMEOUT", 1))
-        self.playing = False
-        self.player_msg = None
+        self.PLAYLIST_FANOUT = int(getenv("PLAYLIST_FANOUT", 4))
+        self.SPOTIFY_MATCH_FANOUT = int(getenv("SPOTIFY_MATCH_FANOUT", 8))
+        self.PROGRESSIVE = getenv("PROGRESSIVE_PLAYBACK", "1") == "1"
+        self.FFMPEG_STREAM_OPTIONS = "-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5"
+        self.CROSSFADE = int(getenv("CROSSFADE", 0))
+        self.MAX_CROSSFADE = 12
+        self.PLAYER_EDIT_INTERVAL = float(getenv("PLAYER_EDIT_INTERVAL", 1))
+        self.LIST_PAGE_SIZE = 10
+
+    async def on_ready(self) -> None:
+        """
+        Starts the player background jobs once the bot is connected
+        """
+        if self.background_started:
+            return
+        self.background_started = True
+        self.bot.loop.create_task(self.cache.run())
+        self.bot.loop.create_task(self.maintain_cache())
+        self.bot.loop.create_task(self.warmer.run())
+        self.bot.loop.create_task(self.journal.run(self.sessions))
+        self.bot.loop.create_task(self.restore_sessions())
+
+    async def close(self) -> None:
+        """
+        Flushes the player state when the bot shuts down
+        """
+        self.cache.save()
+        await self.http.close()
+
+    async def maintain_cache(self) -> None:
+        """
+        Reconciles the songs folder with the cache
+        and then measures the loudness of the songs missing it
+        """
+        await self.cache.map_folder(self.worker)
+        await self.normalizer.run()
+
+    async def restore_sessions(self) -> None:
+        """
+        Restores the sessions journaled before a restart.
+        Guilds without listeners on the voice channel
+        are restored only when someone joins it.
+        The evictor starts afterwards, so it sees the restored songs.
+        """
+        try:
+            for guild_id, snapshot in self.journal.load().items():
+                guild = self.bot.get_guild(guild_id)
+                voice_channel = guild.get_channel(snapshot['voice']) if guild else None
+                if not voice_channel:
+                    self.journal.delete(guild_id)
+                elif any(not member.bot for member in voice_channel.members):
+                    await self.restore_session(guild, snapshot)
+                else:
+                    self.pending_restores[guild_id] = snapshot
+            self.logger.info(
+                f"Sessoes restauradas, {len(self.pending_restores)} aguardando ouvintes.")
+        finally:
+            self.bot.loop.create_task(self.evictor.run())
+
+    async def on_voice_join(self, voice_channel) -> None:
+        snapshot = self.pending_restores.get(voice_channel.guild.id)
+        if snapshot and snapshot['voice'] == voice_channel.id:
+            del self.pending_restores[voice_channel.guild.id]
+            await self.restore_session(voice_channel.guild, snapshot)
+
+    async def restore_session(self, guild, snapshot: dict) -> None:
+        """
+        Rebuilds the guild queue from the songs already on the cache
+        and resumes the current song from its last offset
+        """
+        session = self.get_guild_session(guild.id)
+        if session.playing:
+            return
+        entries = snapshot['queue']
+        if 'current' in snapshot:
+            entries = [snapshot['current'][:2]] + entries
+        for idx, (song_id, requester_id) in enumerate(entries):
+            song = self.cache.get_song(song_id)
+            if not song:
+                continue
+            requester = guild.get_member(requester_id) if requester_id else None
+            if idx == 0 and 'current' in snapshot:
+                session.resume_offset = snapshot['current'][2]
+            session.queue.put(QueueEntry.create(song, requester, guild.id))
+
+        voice_channel = guild.get_channel(snapshot['voice'])
+        text_channel = guild.get_channel(snapshot['text'])
+        if session.queue.empty() or not text_channel:
+            self.close_session(session)
+            return
+        self.logger.info(f"Restaurando sessao da guild {guild.id}.")
+        session.playing = True
+        session.create_task(self.play_queue(session, voice_channel, text_channel))
 
     async def play(self, ctx: Context, play_text: str) -> None:
         if ctx.author.voice is None:
@@ -54,7 +188,8 @@ class Player:
 
         embed_msg = Embed(title=f":mag_right: **Procurando**: `{play_text}`",
                           color=0x550A8A)
-        if ctx.message == self.player_msg:
+        session = self.find_session(ctx)
+        if session and ctx.message == session.player_msg:
             await ctx.respond(embed=embed_msg, ephemeral=True, delete_after=self.bot.delete_time)
         else:
             await ctx.respond(embed=embed_msg, ephemeral=True)
@@ -63,23 +198,12 @@ class Player:
         await self.handle_song_request(play_text, ctx)
 
     async def list(self, ctx: Context) -> None:
-        queue = self.get_queue(ctx)
-        if not queue.empty():
-            list_buffer = ""
-            queue_duration = 0
-            for idx, song in enumerate(list(queue.queue), 1):
-                list_buffer += (f"**{idx}.** *" + song.title + "* " +
-                                f"`{timedelta(seconds=song.duration)}`" +
-                                f" {song.requester.mention}" + "\n")
-                queue_duration += song.duration
-            embed_msg = Embed(title=":play_pause: **Fila**",
-                              description=list_buffer,
-                              color=0x550A8A)
-            embed_msg.set_footer(
-                text=
-                f"Duração da fila: {str(timedelta(seconds=queue_duration))}")
+        session = self.find_session(ctx)
+        queue = session.queue if session else None
+        if queue and not queue.empty():
             self.bot.loop.create_task(
-                ctx.respond(embed=embed_msg,
+                ctx.respond(embed=self.queue_page_embed(queue, 0),
+                            view=self.create_list_view(queue),
                             delete_after=self.bot.delete_time,
                             ephemeral=True))
             self.logger.info("O bot recuperou a fila de reprodução.")
@@ -159,142 +283,277 @@ class Player:
             if ctx.voice_client.channel == ctx.author.voice.channel:
                 ctx.voice_client.pause()
 
-                if self.player_msg:
-                    embed_msg = Embed(
-                        title=f":pause_button: **Pausado**",
-                        description=
-                        f"`{self.current_song[ctx.guild.id].title}`",
-                        color=0x550A8A,
-                    )
-                    embed_msg.set_thumbnail(
-                        url=self.current_song[ctx.guild.id].thumb)
-
-                    if self.current_song[ctx.guild.id].requester:
-                        embed_msg.set_footer(
-                            text=
-                            f"Adicionada por {self.current_song[ctx.guild.id].requester.display_name}",
-                            icon_url=self.current_song[
-                                ctx.guild.id].requester.avatar.url,
-                        )
-
-                    await self.player_msg.edit(embed=embed_msg)
+                session = self.find_session(ctx)
+                if session and session.updater and session.current_entry:
+                    embed_msg = self.song_embed(session.current_entry,
+                                                ":pause_button: **Pausado**")
+                    session.updater.update(embed=embed_msg)
 
     async def resume(self, ctx: Context) -> None:
         if ctx.author.voice is not None:
             if ctx.voice_client.channel == ctx.author.voice.channel:
                 ctx.voice_client.resume()
 
-                if self.player_msg:
-                    embed_msg = Embed(
-                        title=f":arrow_forward: **Reproduzindo**",
-                        description=
-                        f"`{self.current_song[ctx.guild.id].title}`",
-                        color=0x550A8A,
-                    )
-                    embed_msg.set_thumbnail(
-                        url=self.current_song[ctx.guild.id].thumb)
-
-                    if self.current_song[ctx.guild.id].requester:
-                        embed_msg.set_footer(
-                            text=
-                            f"Adicionada por {self.current_song[ctx.guild.id].requester.display_name}",
-                            icon_url=self.current_song[
-                                ctx.guild.id].requester.avatar.url,
-                        )
-
-                    await self.player_msg.edit(embed=embed_msg)
+                session = self.find_session(ctx)
+                if session and session.updater and session.current_entry:
+                    embed_msg = self.song_embed(session.current_entry,
+                                                ":arrow_forward: **Reproduzindo**")
+                    session.updater.update(embed=embed_msg)
 
     async def next(self, ctx: Context) -> None:
         if ctx.author.voice is not None:
             if ctx.voice_client.channel == ctx.author.voice.channel:
-                ctx.voice_client.stop()
+                session = self.find_session(ctx)
+                if session and session.source:
+                    session.source.skip()
+                    if ctx.voice_client.is_paused():
+                        ctx.voice_client.resume()
+                else:
+                    ctx.voice_client.stop()
 
-    async def play_queue(self, ctx: Context) -> None:
+    async def seek(self, ctx: Context, seconds: float) -> int:
+        """
+        Reopens the current song at another position
+        Return the new position or None if nothing is playing
+        """
+        if ctx.author.voice is not None and ctx.voice_client is not None:
+            if ctx.voice_client.channel == ctx.author.voice.channel:
+                session = self.find_session(ctx)
+                song = session.current_song if session else None
+                if song and session.source:
+                    await self.refresh_stream(song, ctx.guild.id)
+                    offset = int(max(0, min(seconds, (song.duration or 1) - 1)))
+                    audio = self.get_audio_source(song, session.source.is_opus(),
+                                                  offset)
+                    session.source.seek(audio, offset)
+                    self.journal.mark(session)
+                    self.logger.info(
+                        f"O bot posicionou a música {song.id} em {offset}s.")
+                    return offset
+        return None
+
+    async def forward(self, ctx: Context, seconds: int) -> int:
+        session = self.find_session(ctx)
+        position = session.source.position() if session and session.source else 0
+        return await self.seek(ctx, position + seconds)
+
+    async def rewind(self, ctx: Context, seconds: int) -> int:
+        session = self.find_session(ctx)
+        position = session.source.position() if session and session.source else 0
+        return await self.seek(ctx, position - seconds)
+
+    async def crossfade(self, ctx: Context, seconds: int) -> int:
+        """
+        Sets the crossfade length of the guild player
+        Return the new length or None if nothing is playing
+        """
+        session = self.find_session(ctx)
+        if not session:
+            return None
+        session.crossfade = max(0, min(seconds, self.MAX_CROSSFADE))
+        if session.source:
+            session.source.set_crossfade(session.crossfade)
+            self.preload(session)
+        self.logger.info(f"Crossfade ajustado para {session.crossfade}s.")
+        return session.crossfade
+
+    async def play_queue(self, session: GuildSession, voice_channel,
+                         text_channel) -> None:
         try:
-            self.playing = True
-            if ctx.voice_client is None:
-                await ctx.author.voice.channel.connect()
-
-            queue = self.get_queue(ctx)
-            voice_client = ctx.voice_client
-            idle_timer = 0
-            self.logger.info("O bot está reproduzindo a fila.")
-
-            while idle_timer < self.IDLE_TIMEOUT:
-                while not queue.empty():
-                    self.playing = True
-                    self.current_song[ctx.guild.id] = queue.get()
-
-                    current_playing_song_embed_msg = Embed(
-                        title=f":arrow_forward: **Reproduzindo**",
-                        description=
-                        f"`{self.current_song[ctx.guild.id].title}`",
-                        color=0x550A8A,
-                    )
-                    current_playing_song_embed_msg.set_thumbnail(
-                        url=self.current_song[ctx.guild.id].thumb)
-
-                    if self.current_song[ctx.guild.id].requester:
-                        current_playing_song_embed_msg.set_footer(
-                            text=
-                            f"Adicionada por {self.current_song[ctx.guild.id].requester.display_name}",
-                            icon_url=self.current_song[
-                                ctx.guild.id].requester.avatar.url,
-                        )
+            session.playing = True
+            session.text_channel = text_channel
+            queue = session.queue
+            track_ended = Event()
 
-                    if self.player_msg:
-                        self.player_msg = await self.player_msg.edit(
-                            embed=current_playing_song_embed_msg)
-                    else:
-                        await self.create_btn_view()
+            # Songs added while the bot was disconnecting start a new round
+            while not queue.empty():
+                if voice_channel.guild.voice_client is None:
+                    session.voice_client = await voice_channel.connect()
+                else:
+                    session.voice_client = voice_channel.guild.voice_client
+                voice_client = session.voice_client
+                self.logger.info("O bot está reproduzindo a fila.")
 
-                        self.player_msg = await ctx.channel.send(
-                            embed=current_playing_song_embed_msg,
-                            view=self.coltrol_view
-                        )
+                while True:
+                    if queue.empty():
+                        try:
+                            await wait_for(queue.wait(), self.IDLE_TIMEOUT)
+                        except TimeoutError:
+                            break
+                        continue
 
+                    session.current_entry = queue.get()
+                    if not await self.resolve_pending(session.current_song,
+                                                      session.guild_id):
+                        self.logger.info(
+                            f"Musica {session.current_entry.id} nao encontrada, pulando.")
+                        session.current_entry = None
+                        continue
+                    await self.refresh_stream(session.current_song,
+                                              session.guild_id)
+                    offset, session.resume_offset = session.resume_offset, 0
+                    opus = self.prefetcher.OPUS and not session.crossfade
+                    session.source = QueueSource(
+                        session.current_entry,
+                        self.get_audio_source(session.current_song, opus, offset),
+                        on_track_change=lambda entry: self.bot.loop.call_soon_threadsafe(
+                            self.on_track_change, session, entry),
+                        crossfade=session.crossfade,
+                        offset=offset)
+
+                    track_ended.clear()
                     voice_client.play(
-                        FFmpegPCMAudio(self.current_song[ctx.guild.id].path))
-
-                    while voice_client.is_playing() or voice_client.is_paused(
-                    ):
-                        bnt_next_disabled = self.coltrol_view.get_item('btn_next').disabled
-                        btn_list = self.coltrol_view.get_item('btn_list')
-
-                        if queue.empty():
-                            if bnt_next_disabled == False or btn_list.disabled == False:
-                                self.coltrol_view.get_item('btn_next').disabled = True
-                                self.coltrol_view.get_item('btn_list').disabled = True
-                                self.coltrol_view.get_item('btn_list').label = ""
-                                await self.player_msg.edit(view=self.coltrol_view)
-                        elif not queue.empty():
-                            if bnt_next_disabled == True or btn_list.disabled == True or str(btn_list.label) != str(queue.qsize()):
-                                self.coltrol_view.get_item('btn_next').disabled = False
-                                self.coltrol_view.get_item('btn_list').disabled = False
-                                self.coltrol_view.get_item('btn_list').label = str(queue.qsize())
-                                await self.player_msg.edit(view=self.coltrol_view)
-                        await sleep(1)
-
-                    self.playing = False
-                    idle_timer = 0
-                    del self.current_song[ctx.guild.id]
-
-                await sleep(1)
-                idle_timer += 1
-
-            await ctx.voice_client.disconnect()
-            await self.player_msg.delete()
-            self.player_msg = None
-            self.logger.info(
-                "O bot desconectou do canal após reproduzir a fila.")
+                        session.source,
+                        after=lambda err: self.on_track_end(err, track_ended))
+                    self.prefetch(session)
+                    self.preload(session)
+                    self.journal.mark(session)
+                    await self.show_current_song(session)
+
+                    await track_ended.wait()
+                    if self.bot.is_closed():
+                        return
+                    session.source = None
+                    session.current_entry = None
+
+                await voice_client.disconnect()
+                if session.updater:
+                    session.updater.close()
+                    session.updater = None
+                if session.player_msg:
+                    await session.player_msg.delete()
+                    session.player_msg = None
+                self.logger.info(
+                    "O bot desconectou do canal após reproduzir a fila.")
+            session.playing = False
         except Exception:
+            session.playing = False
             error = str(traceback.format_exc())
             self.logger.error(error)
             await self.bot.send_exception(error, command='player')
+        finally:
+            # Only a shutdown keeps the journal to resume the queue
+            self.close_session(session, forget=not self.bot.is_closed())
         return
     
-    async def create_btn_view(self) -> View:
-        self.coltrol_view = View()
+    def on_track_end(self, err: Exception, track_ended: Event) -> None:
+        """
+        Called from the voice thread when the queue source stops
+        """
+        if err:
+            self.logger.error(f"Erro na reproducao da musica [{err!r}]")
+        self.bot.loop.call_soon_threadsafe(track_ended.set)
+
+    def on_track_change(self, session: GuildSession, entry: QueueEntry) -> None:
+        """
+        Called when the queue source moves on to the pre-opened next track
+        """
+        if session.queue.peek() is entry:
+            session.queue.get()
+        session.current_entry = entry
+        self.prefetch(session)
+        self.preload(session)
+        self.journal.mark(session)
+        if session.updater:
+            session.create_task(self.show_current_song(session))
+
+    def preload(self, session: GuildSession) -> None:
+        """
+        Opens the head of the queue ahead of time on the queue source
+        A source in a different mode than the guild wants is left to end,
+        so the player restarts it in the new mode
+        A head still being prefetched is opened once its download completes,
+        so it plays from disk instead of holding a stream open
+        """
+        source = session.source
+        if not source:
+            return
+        opus = self.prefetcher.OPUS and not session.crossfade
+        next_entry = None
+        if source.is_opus() == opus:
+            next_entry = session.queue.peek()
+        download = self.prefetcher.downloads.get(next_entry.id) if next_entry else None
+        if download:
+            if session.preload_wait is not download:
+                session.preload_wait = download
+                download.add_done_callback(lambda task: self.preload(session))
+            next_entry = None
+        elif next_entry and (not next_entry.song.path or (
+                not path.exists(next_entry.song.path)
+                and is_stream_expired(next_entry.song.stream_url))):
+            # Left for the player to resolve when the track starts
+            next_entry = None
+        if source.next_entry is not next_entry:
+            next_source = None
+            if next_entry:
+                next_source = self.get_audio_source(next_entry.song, opus)
+            source.set_next(next_entry, next_source)
+
+    async def show_current_song(self, session: GuildSession) -> None:
+        """
+        Shows the current song on the player message
+        """
+        if not session.current_entry:
+            return
+        embed_msg = self.song_embed(session.current_entry,
+                                    ":arrow_forward: **Reproduzindo**")
+        if session.updater:
+            session.updater.update(embed=embed_msg)
+        else:
+            self.create_btn_view(session)
+            session.player_msg = await session.text_channel.send(
+                embed=embed_msg, view=session.control_view)
+            session.updater = MessageUpdater(session.player_msg, self.logger,
+                                             self.PLAYER_EDIT_INTERVAL)
+        self.update_view(session)
+
+    def song_embed(self, entry: QueueEntry, title: str) -> Embed:
+        """
+        Builds the player message embed for a queue entry
+        """
+        embed_msg = Embed(
+            title=title,
+            description=f"`{entry.song.title}`",
+            color=0x550A8A,
+        )
+        embed_msg.set_thumbnail(url=entry.song.thumb)
+
+        if entry.requester:
+            embed_msg.set_footer(
+                text=f"Adicionada por {entry.requester.display_name}",
+                icon_url=entry.requester.avatar.url,
+            )
+        return embed_msg
+
+    def update_view(self, session: GuildSession) -> None:
+        """
+        Refreshes the control buttons with the queue state
+        """
+        if not session.updater:
+            return
+        queue = session.queue
+        btn_next = session.control_view.get_item('btn_next')
+        btn_list = session.control_view.get_item('btn_list')
+        label = str(queue.qsize()) if not queue.empty() else ""
+
+        if btn_next.disabled != queue.empty() or btn_list.disabled != queue.empty() \
+                or str(btn_list.label or "") != label:
+            btn_next.disabled = queue.empty()
+            btn_list.disabled = queue.empty()
+            btn_list.label = label
+            session.updater.update(view=session.control_view)
+
+    def on_queue_change(self, session: GuildSession) -> None:
+        """
+        Refreshes prefetch, preload and buttons
+        """
+        self.prefetch(session)
+        self.preload(session)
+        self.journal.mark(session)
+        self.update_view(session)
+
+    def create_btn_view(self, session: GuildSession) -> View:
+        session.control_view = View()
         
         btn_play_pause = Button(
             custom_id='btn_play_pause',
@@ -335,13 +594,73 @@ class Player:
         btn_add.callback = self.btn_add
         btn_leave.callback = self.btn_leave
 
-        self.coltrol_view.add_item(btn_play_pause)
-        self.coltrol_view.add_item(btn_next)
-        self.coltrol_view.add_item(btn_list)
-        self.coltrol_view.add_item(btn_add)
-        self.coltrol_view.add_item(btn_leave)
-        return self.coltrol_view
+        session.control_view.add_item(btn_play_pause)
+        session.control_view.add_item(btn_next)
+        session.control_view.add_item(btn_list)
+        session.control_view.add_item(btn_add)
+        session.control_view.add_item(btn_leave)
+        return session.control_view
+
+
+    def queue_page_embed(self, queue: SongQueue, page: int) -> Embed:
+        """
+        Builds the embed of one page of the queue
+        """
+        start = page * self.LIST_PAGE_SIZE
+        list_buffer = ""
+        for idx, entry in enumerate(
+                queue.slice(start, start + self.LIST_PAGE_SIZE), start + 1):
+            list_buffer += (f"**{idx}.** *" + entry.song.title + "* " +
+                            f"`{timedelta(seconds=entry.duration)}`" +
+                            f" {entry.requester.mention if entry.requester else ''}" + "\n")
+        embed_msg = Embed(title=":play_pause: **Fila**",
+                          description=list_buffer,
+                          color=0x550A8A)
+        embed_msg.set_footer(
+            text=
+            f"Duração da fila: {str(timedelta(seconds=queue.duration))}"
+            f" | Página {page + 1}/{self.queue_pages(queue)}")
+        return embed_msg
+
+    def queue_pages(self, queue: SongQueue) -> int:
+        return max(1, ceil(queue.qsize() / self.LIST_PAGE_SIZE))
+
+    def create_list_view(self, queue: SongQueue) -> View:
+        """
+        Creates the buttons to turn the pages of the queue listing
+        """
+        list_view = View()
+        page = 0
+
+        async def turn_page(iteraction: Interaction, step: int) -> None:
+            nonlocal page
+            page = max(0, min(page + step, self.queue_pages(queue) - 1))
+            await iteraction.response.edit_message(
+                embed=self.queue_page_embed(queue, page), view=list_view)
+
+        btn_prev = Button(style=ButtonStyle.secondary, emoji='◀')
+        btn_next = Button(style=ButtonStyle.secondary, emoji='▶')
+        btn_prev.callback = lambda iteraction: turn_page(iteraction, -1)
+        btn_next.callback = lambda iteraction: turn_page(iteraction, 1)
+        list_view.add_item(btn_prev)
+        list_view.add_item(btn_next)
+        return list_view
 
+    async def move(self, ctx: Context, src: int, dst: int) -> bool:
+        """
+        Move song to another position of the queue.
+        """
+        if ctx.author.voice is not None and ctx.voice_client is not None:
+            if ctx.voice_client.channel == ctx.author.voice.channel:
+                session = self.find_session(ctx)
+                queue = session.queue if session else None
+                if queue and 1 <= src <= queue.qsize() and 1 <= dst <= queue.qsize():
+                    queue.move(src - 1, dst - 1)
+                    self.on_queue_change(session)
+                    self.logger.info(
+                        f"O bot moveu a música da posição {src} para {dst}.")
+                    return True
+        return False
 
     async def remove(self, ctx: Context, idx: int) -> None:
         """
@@ -349,8 +668,9 @@ class Player:
         """
         if ctx.author.voice is not None and ctx.voice_client is not None:
             if ctx.voice_client.channel == ctx.author.voice.channel:
-                queue = self.get_queue(ctx)
-                if queue.empty():
+                session = self.find_session(ctx)
+                queue = session.queue if session else None
+                if not queue or queue.empty():
                     embed_msg = Embed(
                         title="Fila vazia",
                         description="Adicione músicas :)",
@@ -359,8 +679,9 @@ class Player:
                     self.bot.loop.create_task(
                         ctx.respond(embed=embed_msg,
                                     delete_after=self.bot.delete_time))
-                if idx <= queue.qsize():
-                    del queue.queue[idx - 1]
+                elif 1 <= idx <= queue.qsize():
+                    queue.remove(idx - 1)
+                    self.on_queue_change(session)
                     self.logger.info(
                         f"O bot removeu a música de posição {idx-1} da fila.")
                     self.bot.loop.create_task(
@@ -381,13 +702,14 @@ class Player:
         """
         if ctx.author.voice is not None and ctx.voice_client is not None:
             if ctx.voice_client.channel == ctx.author.voice.channel:
-                queue = self.get_queue(ctx)
+                session = self.find_session(ctx)
+                queue = session.queue if session else None
 
-                if queue.empty():
+                if not queue or queue.empty():
                     return False
                 else:
-                    with queue.mutex:
-                        queue.queue.clear()
+                    queue.clear()
+                    self.on_queue_change(session)
                     self.logger.info(f"O bot limpou a fila.")
                     return True
 
@@ -397,9 +719,10 @@ class Player:
         """
         if ctx.author.voice is not None and ctx.voice_client is not None:
             if ctx.voice_client.channel == ctx.author.voice.channel:
-                queue = self.get_queue(ctx)
+                session = self.find_session(ctx)
+                queue = session.queue if session else None
 
-            if queue.empty():
+            if not queue or queue.empty():
                 embed_msg = Embed(
                     title="Fila vazia",
                     description="Adicione músicas :)",
@@ -410,8 +733,8 @@ class Player:
                                 delete_after=self.bot.delete_time))
                 return
             else:
-                with queue.mutex:
-                    shuffle(queue.queue)
+                queue.shuffle()
+                self.on_queue_change(session)
                 embed_msg = Embed(
                     title=":twisted_rightwards_arrows: **Fila embaralhada**",
                     color=0x550A8A,
@@ -428,47 +751,207 @@ class Player:
         is_youtube_link = match(
             r"https:\/\/www\.youtube\.com\/watch.*|https:\/\/youtu.be\/.*",
             play_text)
+        is_spotify_collection = match(SPOTIFY_COLLECTION, play_text)
         if is_youtube_playlist:
             await self.add_playlist(play_text, ctx)
+        elif is_spotify_collection:
+            await self.add_playlist(play_text, ctx,
+                                    self.spotify.iter_tracks(play_text),
+                                    self.match_spotify_track,
+                                    self.SPOTIFY_MATCH_FANOUT)
         elif is_youtube_link:
             await self.add_song(play_text, ctx, link=True)
         else:
             await self.add_song(play_text, ctx)
 
-    async def add_playlist(self, play_list_url: str, ctx: Context) -> None:
+    async def add_playlist(self, play_list_url: str, ctx: Context,
+                           items=None, resolve_item=None,
+                           fanout: int = None) -> None:
         """
-        Downloads all songs from a playlist and put them on que queue
+        Resolves the songs from a playlist concurrently while its pages
+        are still being discovered and put them on the queue in playlist order
+        Items are youtube urls unless a coroutine to resolve them is given
         """
-        songs_url = get_youtube_playlist_songlist(play_list_url)
+        if items is None:
+            items = iter_youtube_playlist(self.http, play_list_url)
+        if resolve_item is None:
+            resolve_item = lambda url: self.resolve_song(url, ctx, link=True)
         requester = ctx.author
+        fanout = fanout or self.PLAYLIST_FANOUT
+        tasks = Queue(maxsize=fanout * 4)
+        fanout = Semaphore(fanout)
+        discovered = 0
+
+        async def resolve(item):
+            async with fanout:
+                try:
+                    return await resolve_item(item)
+                except Exception:
+                    self.logger.error(traceback.format_exc())
+
+        async def discover() -> None:
+            nonlocal discovered
+            try:
+                async for item in items:
+                    task = self.bot.loop.create_task(resolve(item))
+                    try:
+                        await tasks.put(task)
+                    except CancelledError:
+                        task.cancel()
+                        raise
+                    discovered += 1
+            except Exception:
+                self.logger.error(traceback.format_exc())
+            finally:
+                await tasks.put(None)
+
+        discovery = self.bot.loop.create_task(discover())
+        idx = 0
+        added = 0
+        last_update = 0
+        show_progress = True
+        try:
+            while True:
+                task = await tasks.get()
+                if task is None:
+                    break
+                idx += 1
+                song = await task
+                if song:
+                    await self.enqueue_song(song, ctx, playlist=True)
+                    added += 1
+
+                if show_progress and self.bot.loop.time() - last_update >= 1:
+                    last_update = self.bot.loop.time()
+                    total = f"{discovered}+" if not discovery.done() else discovered
+                    embed_msg = self.playlist_embed(play_list_url, requester,
+                                                    f"{idx}/{total}", added)
+                    try:
+                        await ctx.edit(embed=embed_msg)
+                    except Exception as e:
+                        # The interaction token expires on long imports
+                        self.logger.error(f"Erro ao atualizar progresso da playlist [{e}]")
+                        show_progress = False
+        finally:
+            discovery.cancel()
+            while not tasks.empty():
+                task = tasks.get_nowait()
+                if task:
+                    task.cancel()
+
+        if not idx:
+            embed_msg = Embed(title=f":x: **Playlist não encontrada**",
+                              color=0xEB2828)
+        else:
+            embed_msg = self.playlist_embed(play_list_url, requester,
+                                            f"{idx}/{idx}", added)
+            embed_msg.title = f":notepad_spiral: **Playlist adicionada a fila** :thumbsup:"
+        self.logger.info("O bot adicionou as músicas da playlist.")
+        try:
+            await ctx.edit(embed=embed_msg, delete_after=self.bot.delete_time)
+        except Exception as e:
+            self.logger.error(f"Erro ao atualizar progresso da playlist [{e}]")
+
+    async def match_spotify_track(self, track: tuple):
+        """
+        Finds the youtube song of a spotify track without extracting it,
+        songs missing from the cache are queued unresolved
+        and left to the prefetcher
+        The match is cached by the spotify track id once the song resolves
+        """
+        track_id, query, duration = track
+        key = f"spotify:{track_id}"
+        video_id = self.queries.get(key, normalize=False)
+        if not video_id:
+            song_url = await get_song_youtube_url(self.http, query)
+            video_id = song_url.rsplit("=", 1)[1]
+        song = self.cache.get_song(video_id) or self.resolved.get(video_id)
+        if song:
+            if song.path:
+                self.queries.put(key, video_id, normalize=False)
+            return song
+        song = Song(video_id, {
+            'url': f"https://www.youtube.com/watch?v={video_id}",
+            'title': query,
+            'duration': duration,
+            'thumb': None,
+        })
+        song.query_key = key
+        self.resolved[video_id] = song
+        return song
 
+    async def resolve_pending(self, song, guild_id: int) -> bool:
+        """
+        Extracts a song queued unresolved, caching the query
+        that matched it once it resolves
+        Return if the song is resolved
+        """
+        if song.path:
+            return True
+        resolved = self.cache.get_song(song.id)
+        if not resolved:
+            resolved = await self.flights.run(song.id, self.fetch_song,
+                                              guild_id, song.url)
+        if not resolved:
+            if song.query_key:
+                self.queries.delete(song.query_key)
+            return False
+        if not song.path:
+            song.from_dict(resolved.to_dict())
+            song.stream_url = resolved.stream_url
+        if song.query_key:
+            self.queries.put(song.query_key, song.id, normalize=False)
+            song.query_key = None
+        return True
+
+    def playlist_embed(self, play_list_url: str, requester, progress: str,
+                       added: int) -> Embed:
+        """
+        Builds the progress embed of a playlist being added
+        """
         embed_msg = Embed(
-            title=f":notepad_spiral: **Playlist adicionada a fila** :thumbsup:",
+            title=f":notepad_spiral: **Adicionando playlist a fila**",
             description=f"`{play_list_url}`",
             color=0x550A8A,
         )
+        embed_msg.add_field(name="Progresso", value=progress)
+        embed_msg.add_field(name="Adicionadas", value=str(added))
         embed_msg.set_footer(
             text=f"Adicionada por {requester.display_name}",
             icon_url=requester.avatar.url,
         )
-
-        self.bot.loop.create_task(
-            ctx.edit(embed=embed_msg, delete_after=self.bot.delete_time))
-        for song_url in songs_url:
-            await self.add_song(song_url, ctx, link=True, playlist=True)
-        self.logger.info("O bot adicionou as músicas da playlist.")
+        return embed_msg
 
     async def add_song(self,
                        song_name: str,
                        ctx: Context,
-                       link=False,
-                       playlist=False) -> None:
+                       link=False) -> None:
         """
-        A parallel function to search, download the song and put on the queue
+        Search, download the song and put on the queue
         Starts the player if it's not running
         """
+        song = await self.resolve_song(song_name, ctx, link)
+        if not song:
+            self.logger.info("Música não encontrada")
+            music_not_found_msg = Embed(
+                title=f":x: **Música não encontrada**", color=0xEB2828)
+            await ctx.edit(embed=music_not_found_msg,
+                           delete_after=self.bot.delete_time)
+            return
+        await self.enqueue_song(song, ctx)
+
+    async def resolve_song(self, song_name: str, ctx: Context, link=False):
+        """
+        Finds the song on the cache, otherwise resolves it on youtube
+        """
+        cached_id = None
         if not link:
-            song_url = get_song_url(song_name)
+            cached_id = self.queries.get(song_name)
+            if cached_id:
+                self.logger.info(f"Busca encontrada em cache: {cached_id}.")
+                song_url = f"https://www.youtube.com/watch?v={cached_id}"
+            else:
+                song_url = await get_song_url(self.http, song_name)
         else:
             song_url = song_name
 
@@ -477,35 +960,63 @@ class Player:
         id = str(result_id.group(1) or result_id.group(2))
 
         self.logger.info(f"ID:{id} \tURL:{song_url}")
-        song = self.cache.get_song(id)
+        song = self.cache.get_song(id) or self.resolved.get(id)
         if not song:
-            self.logger.info("Musica nao encontrada em cache, baixando.")
-            song = download_song("songs", song_url, requester=ctx.author)
+            if self.flights.in_flight(id):
+                self.logger.info(f"Musica {id} ja esta sendo resolvida, aguardando.")
+            song = await self.flights.run(id, self.fetch_song, ctx.guild.id,
+                                          song_url)
+            if song and not self.cache.has_song(id):
+                song = self.resolved.setdefault(id, song)
+        if not link:
             if not song:
-                self.logger.info("Música não encontrada")
-                music_not_found_msg = Embed(
-                    title=f":x: **Música não encontrada**", color=0xEB2828)
-                await ctx.edit(embed=music_not_found_msg,
-                               delete_after=self.bot.delete_time)
-                return
-            self.cache.add_song(song)
+                self.queries.delete(self.queries.normalize(song_name))
+            elif not cached_id:
+                self.queries.put(song_name, id)
+        return song
+
+    async def fetch_song(self, guild_id: int, song_url: str):
+        """
+        Resolves a song missing from the cache,
+        downloading it when progressive playback is off
+        """
+        if self.PROGRESSIVE:
+            self.logger.info("Musica nao encontrada em cache, resolvendo stream.")
+            song = await self.worker.run(guild_id, get_song_info,
+                                         "songs", song_url)
+            if song:
+                self.prefetcher.keep_info(song)
+        else:
+            self.logger.info("Musica nao encontrada em cache, baixando.")
+            song = await self.worker.run(guild_id, download_song,
+                                         "songs", song_url)
+            if song:
+                self.cache.add_song(song)
+        return song
 
-        song.requester = ctx.author
+    async def enqueue_song(self, song, ctx: Context, playlist=False) -> None:
+        """
+        Put a resolved song on the queue
+        Starts the player if it's not running
+        """
+        id = song.id
         self.cache.increment_plays(id)
-        queue = self.get_queue(ctx)
-        queue.put(song)
+        session = self.get_session(ctx)
+        queue = session.queue
+        queue.put(QueueEntry.create(song, ctx.author, ctx.guild.id))
+        self.on_queue_change(session)
         self.logger.info("Musica adicionada na fila de reproducao.")
         self.bot.db.insert_event(ctx.author.id, EVENT_TYPES.MUSIC_PLAY.value, ctx.guild.id, id)
 
-        if self.playing:
+        if session.playing:
             if not playlist:
                 embed_msg = Embed(
                     title=f":thumbsup: **Adicionado a fila de reprodução**",
                     description=f"`{song.title}`",
                     color=0x550A8A,
                 )
-                embed_msg.set_footer(text=f"Posição: {len(queue.queue)}")
-                if ctx.message == self.player_msg:
+                embed_msg.set_footer(text=f"Posição: {queue.qsize()}")
+                if ctx.message == session.player_msg:
                     self.bot.loop.create_task(
                         ctx.followup.send(
                             embed=embed_msg,
@@ -519,16 +1030,92 @@ class Player:
                                 delete_after=self.bot.delete_time))
             self.logger.info("O bot adicionou a música na fila de reprodução.")
         else:
-            self.playing = True
-            await ctx.edit(delete_after=self.bot.delete_time)
-            self.bot.loop.create_task(self.play_queue(ctx))
+            session.playing = True
+            session.create_task(
+                self.play_queue(session, ctx.author.voice.channel, ctx.channel))
+            if not playlist:
+                await ctx.edit(delete_after=self.bot.delete_time)
+
+    def prefetch(self, session: GuildSession) -> None:
+        """
+        Updates the lookahead window of the guild queue
+        """
+        songs = [entry.song for entry in
+                 session.queue.slice(0, self.prefetcher.SIZE)]
+        if session.current_song:
+            songs.insert(0, session.current_song)
+        self.prefetcher.update(session.guild_id, songs)
+
+    async def refresh_stream(self, song, guild_id: int) -> None:
+        """
+        Extracts a new stream url for a song not on disk
+        when its current one is missing or expired
+        """
+        if path.exists(song.path) or not is_stream_expired(song.stream_url):
+            return
+        self.logger.info(f"Renovando stream da musica {song.id}.")
+        fresh = await self.worker.run(guild_id, get_song_info, "songs", song.url)
+        if fresh:
+            song.stream_url = fresh.stream_url
+
+    def get_audio_source(self, song, opus: bool, offset: float = 0) -> AudioSource:
+        """
+        Reads the opus rendition of the song from disk without transcoding,
+        seeking through its page index, falls back to the downloaded file
+        or to its stream url while the download is not complete
+        """
+        seek_options = f"-ss {offset}" if offset else None
+        if opus and song.opus_path and path.exists(song.opus_path):
+            return OpusFileAudio(song.opus_path, offset)
+        if path.exists(song.path) or not song.stream_url:
+            source, before_options = song.path, seek_options
+        else:
+            self.logger.info(f"Reproduzindo musica {song.id} via stream.")
+            source, before_options = song.stream_url, self.FFMPEG_STREAM_OPTIONS
+            if seek_options:
+                before_options = f"{before_options} {seek_options}"
+
+        if opus:
+            options = None
+            if song.loudness_gain:
+                options = f"-af volume={song.loudness_gain}dB"
+            return FFmpegOpusAudio(source, before_options=before_options,
+                                   options=options)
+        audio = FFmpegPCMAudio(source, before_options=before_options)
+        if song.loudness_gain:
+            return PCMVolumeTransformer(audio,
+                                        volume=10**(song.loudness_gain / 20))
+        return audio
+
+    def find_session(self, ctx: Context) -> GuildSession:
+        """
+        Return the guild session or None if there is none
+        """
+        return self.sessions.get(ctx.guild.id)
 
-    def get_queue(self, ctx: Context) -> Queue:
+    def get_session(self, ctx: Context) -> GuildSession:
         """
-        Checks if queue exists
+        Checks if the guild session exists
         Create one if it does not
         Return if exists
         """
-        if not ctx.guild.id in self.song_queue:
-            self.song_queue[ctx.guild.id] = Queue()
-        return self.song_queue[ctx.guild.id]
+        return self.get_guild_session(ctx.guild.id)
+
+    def get_guild_session(self, guild_id: int) -> GuildSession:
+        if not guild_id in self.sessions:
+            self.sessions[guild_id] = GuildSession(guild_id, self.CROSSFADE)
+        return self.sessions[guild_id]
+
+    def close_session(self, session: GuildSession, forget=True) -> None:
+        """
+        Tears down an idle guild session
+        Its journal is kept when the bot is shutting down,
+        so it is restored after the restart
+        """
+        self.prefetcher.release(session.guild_id)
+        if forget:
+            self.journal.delete(session.guild_id)
+        session.close()
+        if self.sessions.get(session.guild_id) is session:
+            del self.sessions[session.guild_id]
+        self.logger.info(f"Sessao da guild {session.guild_id} encerrada.")
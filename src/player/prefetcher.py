@@ -0,0 +1,133 @@
+from asyncio import create_task
+from collections import OrderedDict
+from os import getenv, path, remove
+
+from src.logger import Logger
+from src.player.audio import (
+    analyze_loudness,
+    build_seek_index,
+    get_index_path,
+    make_opus_rendition,
+)
+from src.player.song import Song
+from src.player.songcache import SongCache
+from src.player.worker import Worker
+from src.player.youtube import fetch_song, is_stream_expired
+
+
+class Prefetcher():
+    """
+    Downloads the upcoming songs of each guild queue into the songs folder
+    while the current one plays, and keeps them pinned on the cache.
+    Songs queued unresolved are extracted first through the resolve coroutine.
+    The info extracted on resolution is kept apart from the shared songs,
+    on a small LRU, so a download can reuse it while it is fresh.
+    """
+
+    INFO_SIZE = 32
+
+    def __init__(self, logger: Logger, cache: SongCache, worker: Worker,
+                 resolve) -> None:
+        self.logger = logger
+        self.cache = cache
+        self.worker = worker
+        self.resolve = resolve
+        self.SIZE = int(getenv('PREFETCH_SIZE', 3))
+        self.OPUS = getenv('OPUS_PASSTHROUGH', '1') == '1'
+        self.LOUDNESS_TARGET = float(getenv('LOUDNESS_TARGET', -16))
+        self.downloads = {}
+        self.infos = OrderedDict()
+        self.no_rendition = set()
+
+    def update(self, guild_id: int, songs: list) -> None:
+        """
+        Receives the current song followed by the guild queue
+        and downloads the ones inside the lookahead window
+        """
+        window = songs[:self.SIZE + 1]
+        self.cache.pin(guild_id, [song.id for song in window])
+        for song in window:
+            if not self.is_ready(song):
+                self.start_download(song, guild_id)
+
+    def is_ready(self, song: Song) -> bool:
+        """
+        Checks if the song media, its loudness,
+        its opus rendition and its seek index are ready
+        """
+        if not song.path or not path.exists(song.path) \
+                or song.loudness_gain is None:
+            return False
+        if not self.OPUS or song.id in self.no_rendition:
+            return True
+        return bool(song.opus_path and path.exists(song.opus_path)
+                    and path.exists(get_index_path(song.opus_path)))
+
+    def keep_info(self, song: Song) -> None:
+        """
+        Moves the extracted info out of a freshly resolved song
+        """
+        if song.info:
+            self.infos[song.id] = song.info
+            self.infos.move_to_end(song.id)
+            while len(self.infos) > self.INFO_SIZE:
+                self.infos.popitem(last=False)
+        song.info = None
+
+    def release(self, guild_id: int) -> None:
+        self.cache.unpin(guild_id)
+
+    def start_download(self, song: Song, guild_id: int) -> None:
+        if song.id not in self.downloads:
+            self.downloads[song.id] = create_task(self.download(song, guild_id))
+
+    async def download(self, song: Song, guild_id: int) -> None:
+        """
+        Downloads the song media, measures its loudness, renders it to opus,
+        indexes the rendition for seeking and adds it to the cache when complete
+        """
+        try:
+            self.logger.info(f'Pre-carregando musica {song.id}.')
+            if not await self.resolve(song, guild_id):
+                self.cache.pending_plays.pop(song.id, None)
+                return
+            if not path.exists(song.path):
+                info = self.infos.pop(song.id, None)
+                if info and is_stream_expired(song.stream_url):
+                    info = None
+                fetched = await self.worker.run(guild_id, fetch_song, song,
+                                                info, background=True)
+                if not fetched and info:
+                    self.logger.info(f'Extraindo novamente a musica {song.id}.')
+                    fetched = await self.worker.run(guild_id, fetch_song, song,
+                                                    background=True)
+                if not fetched:
+                    self.cache.pending_plays.pop(song.id, None)
+                    return
+                self.logger.info(f'Download da musica {song.id} concluido.')
+            if song.loudness_gain is None:
+                song.loudness_gain = await self.worker.run(
+                    guild_id, analyze_loudness, song.path, self.LOUDNESS_TARGET,
+                    background=True)
+                if song.opus_path and path.exists(song.opus_path):
+                    remove(song.opus_path)
+                song.opus_path = None
+            if self.OPUS:
+                song.opus_path = await self.worker.run(
+                    guild_id, make_opus_rendition, song.path,
+                    song.loudness_gain, background=True)
+                if not song.opus_path:
+                    self.no_rendition.add(song.id)
+                else:
+                    await self.worker.run(guild_id, build_seek_index,
+                                          song.opus_path, background=True)
+            self.cache.add_song(song)
+        except Exception as e:
+            self.logger.error(f'Erro ao pre-carregar musica {song.id} [{e}]')
+            if song.path and path.exists(song.path):
+                # Kept without the missing steps, the normalizer retries them
+                self.cache.add_song(song)
+            else:
+                self.cache.pending_plays.pop(song.id, None)
+        finally:
+            del self.downloads[song.id]
@@ -0,0 +1,90 @@
+from collections import OrderedDict
+from os import getenv, makedirs
+from re import match, sub
+from time import time
+import sqlite3
+import unicodedata
+
+from src.logger import Logger
+
+
+QUERY_TABLE = """
+CREATE TABLE IF NOT EXISTS TB_QUERY(
+    QUERY TEXT NOT NULL PRIMARY KEY,
+    VIDEO_ID TEXT NOT NULL,
+    CREATED REAL NOT NULL
+);
+"""
+
+
+class QueryCache():
+    """
+    Maps normalized search queries to the youtube video they resolved to,
+    kept on cfg/cache.db with a time to live and a bounded size,
+    so repeated searches skip the network.
+    """
+
+    def __init__(self, logger: Logger) -> None:
+        self.logger = logger
+        self.cfg_path = 'cfg'
+        self.TTL = int(getenv('QUERY_CACHE_TTL', 7 * 24 * 3600))
+        self.MAX_SIZE = int(getenv('QUERY_CACHE_SIZE', 5000))
+        makedirs(self.cfg_path, exist_ok=True)
+        self.connection = sqlite3.connect(f'{self.cfg_path}/cache.db')
+        self.connection.execute(QUERY_TABLE)
+        self.queries = self.load()
+
+    def load(self) -> OrderedDict:
+        with self.connection:
+            self.connection.execute('DELETE FROM TB_QUERY WHERE CREATED < ?',
+                                    (time() - self.TTL,))
+        cursor = self.connection.execute(
+            'SELECT QUERY, VIDEO_ID, CREATED FROM TB_QUERY ORDER BY CREATED')
+        queries = OrderedDict((query, (id, created)) for query, id, created in cursor)
+        self.logger.info(f'Cache de buscas com {len(queries)} entradas.')
+        return queries
+
+    def normalize(self, query: str) -> str:
+        """
+        Folds case, unicode forms and spaces of a search query,
+        urls are kept as they are since their ids are case sensitive
+        """
+        if match(r'https?://', query.strip()):
+            return query.strip()
+        query = unicodedata.normalize('NFKC', query).casefold()
+        return sub(r'\s+', ' ', query).strip()
+
+    def get(self, query: str, normalize: bool = True) -> str:
+        """
+        Returns the video id of a query or None if unknown or expired
+        """
+        key = self.normalize(query) if normalize else query
+        hit = self.queries.get(key)
+        if not hit:
+            return None
+        id, created = hit
+        if created + self.TTL < time():
+            self.delete(key)
+            return None
+        self.queries.move_to_end(key)
+        return id
+
+    def put(self, query: str, id: str, normalize: bool = True) -> None:
+        key = self.normalize(query) if normalize else query
+        created = time()
+        self.queries[key] = (id, created)
+        self.queries.move_to_end(key)
+        try:
+            with self.connection:
+                self.connection.execute(
+                    'INSERT OR REPLACE INTO TB_QUERY(QUERY, VIDEO_ID, CREATED) '
+                    'VALUES(?, ?, ?)', (key, id, created))
+        except Exception as e:
+            self.logger.error(f'Erro ao salvar busca no cache [{e}]')
+        while len(self.queries) > self.MAX_SIZE:
+            self.delete(next(iter(self.queries)))
+
+    def delete(self, key: str) -> None:
+        self.queries.pop(key, None)
+        with self.connection:
+            self.connection.execute('DELETE FROM TB_QUERY WHERE QUERY=?', (key,))
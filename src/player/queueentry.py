@@ -0,0 +1,31 @@
+from time import time
+from typing import NamedTuple
+
+from discord import Member
+
+from src.player.song import Song
+
+
+class QueueEntry(NamedTuple):
+    """
+    One request on a guild queue. The song is shared with the cache
+    and with every other request of the same track, so requester
+    and guild live here and the song is never changed by the queue.
+    The duration is taken when queued, so the queue total stays
+    consistent when a song queued unresolved learns its own,
+    playback uses the duration of the song itself.
+    """
+
+    song: Song
+    requester: Member
+    guild_id: int
+    enqueued_at: float
+    duration: int
+
+    @classmethod
+    def create(cls, song: Song, requester: Member, guild_id: int):
+        return cls(song, requester, guild_id, time(), song.duration)
+
+    @property
+    def id(self) -> str:
+        return self.song.id
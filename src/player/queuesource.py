@@ -0,0 +1,142 @@
+import audioop
+from threading import Lock
+
+from discord import AudioSource
+from discord.opus import Encoder
+
+from src.player.queueentry import QueueEntry
+
+
+class QueueSource(AudioSource):
+    """
+    Plays the guild queue as one continuous audio stream.
+    The next track is opened ahead of time and the switch happens
+    inside the same read call the current track ends, optionally
+    mixing both tracks during the last seconds when playing PCM.
+    """
+
+    FRAME_MS = Encoder.FRAME_LENGTH
+
+    def __init__(self,
+                 entry: QueueEntry,
+                 source: AudioSource,
+                 on_track_change,
+                 crossfade: int = 0,
+                 offset: float = 0) -> None:
+        self.lock = Lock()
+        self.opus = source.is_opus()
+        self.entry = entry
+        self.source = source
+        self.frames = 0
+        self.offset = offset
+        self.next_entry = None
+        self.next_source = None
+        self.next_frames = 0
+        self.on_track_change = on_track_change
+        self.set_crossfade(crossfade)
+
+    def is_opus(self) -> bool:
+        return self.opus
+
+    def position(self) -> float:
+        """
+        Returns the playback position of the current track in seconds
+        """
+        return self.offset + self.frames * self.FRAME_MS / 1000
+
+    def set_crossfade(self, seconds: int) -> None:
+        """
+        Crossfade needs to mix samples, so it is only applied to PCM
+        """
+        self.crossfade_frames = 0 if self.opus else seconds * 1000 // self.FRAME_MS
+
+    def set_next(self, entry: QueueEntry, source: AudioSource) -> None:
+        """
+        Replaces the pre-opened next track
+        """
+        with self.lock:
+            old_source = self.next_source
+            self.next_entry = entry
+            self.next_source = source
+            self.next_frames = 0
+        if old_source:
+            old_source.cleanup()
+
+    def seek(self, source: AudioSource, offset: float) -> None:
+        """
+        Replaces the current track source with one
+        reopened at another offset
+        """
+        with self.lock:
+            old_source = self.source
+            self.source = source
+            self.frames = 0
+            self.offset = offset
+        if old_source:
+            old_source.cleanup()
+
+    def skip(self) -> None:
+        """
+        Jumps to the next track right away,
+        ends the stream if there is none
+        """
+        with self.lock:
+            self.switch()
+
+    def read(self) -> bytes:
+        with self.lock:
+            data = self.source.read() if self.source else b''
+            if data and self.crossfade_frames and self.next_source:
+                data = self.mix(data)
+            if not data and self.switch():
+                data = self.source.read()
+            self.frames += 1
+            return data
+
+    def mix(self, data: bytes) -> bytes:
+        """
+        Fades the current track out and the next one in,
+        tracks of unknown length are not mixed
+        """
+        duration = self.entry.song.duration
+        if not duration:
+            return data
+        remaining = (duration - self.offset) * 1000 // self.FRAME_MS - self.frames
+        if remaining > self.crossfade_frames:
+            return data
+        next_data = self.next_source.read()
+        if not next_data:
+            return data
+        self.next_frames += 1
+
+        fade = max(remaining, 0) / self.crossfade_frames
+        size = max(len(data), len(next_data))
+        data = audioop.mul(data.ljust(size, b'\0'), 2, fade)
+        next_data = audioop.mul(next_data.ljust(size, b'\0'), 2, 1 - fade)
+        return audioop.add(data, next_data, 2)
+
+    def switch(self) -> bool:
+        """
+        Promotes the next track to current
+        Return if there is a track to continue playing
+        """
+        if self.source:
+            self.source.cleanup()
+        self.entry = self.next_entry
+        self.source = self.next_source
+        self.frames = self.next_frames
+        self.offset = 0
+        self.next_entry = None
+        self.next_source = None
+        self.next_frames = 0
+        if self.entry:
+            self.on_track_change(self.entry)
+        return self.source is not None
+
+    def cleanup(self) -> None:
+        with self.lock:
+            for source in (self.source, self.next_source):
+                if source:
+                    source.cleanup()
+            self.source = None
+            self.next_source = None
@@ -0,0 +1,63 @@
+from asyncio import Task, create_task, current_task
+
+from discord import VoiceClient
+from discord.ui import View
+
+from src.player.messageupdater import MessageUpdater
+from src.player.queueentry import QueueEntry
+from src.player.queuesource import QueueSource
+from src.player.songqueue import SongQueue
+
+
+class GuildSession():
+    """
+    Playback state of a single guild: queue, now playing,
+    control message, voice client and background tasks.
+    """
+
+    def __init__(self, guild_id: int, crossfade: int = 0) -> None:
+        self.guild_id = guild_id
+        self.queue = SongQueue()
+        self.current_entry: QueueEntry = None
+        self.player_msg = None
+        self.updater: MessageUpdater = None
+        self.control_view: View = None
+        self.voice_client: VoiceClient = None
+        self.text_channel = None
+        self.source: QueueSource = None
+        self.crossfade = crossfade
+        self.resume_offset = 0
+        self.preload_wait: Task = None
+        self.playing = False
+        self.tasks = set()
+
+    @property
+    def current_song(self):
+        return self.current_entry.song if self.current_entry else None
+
+    def create_task(self, coro) -> Task:
+        """
+        Runs a coroutine owned by the session,
+        cancelled when the session is closed
+        """
+        task = create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    def close(self) -> None:
+        for task in list(self.tasks):
+            if task is not current_task():
+                task.cancel()
+        self.tasks.clear()
+        if self.updater:
+            self.updater.close()
+        self.queue.clear()
+        self.current_entry = None
+        self.player_msg = None
+        self.updater = None
+        self.control_view = None
+        self.voice_client = None
+        self.text_channel = None
+        self.source = None
+        self.preload_wait = None
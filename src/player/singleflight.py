@@ -0,0 +1,36 @@
+from asyncio import Task, create_task, shield
+
+
+class SingleFlight():
+    """
+    Runs one call per key at a time: callers arriving while a call
+    with the same key is in flight await its result instead of starting
+    another one. The call is only cancelled once every caller
+    waiting for it has been cancelled.
+    """
+
+    def __init__(self) -> None:
+        self.calls = {}
+
+    def in_flight(self, key) -> bool:
+        return key in self.calls
+
+    async def run(self, key, func, *args):
+        call = self.calls.get(key)
+        if not call:
+            call = [create_task(func(*args)), 0]
+            self.calls[key] = call
+            call[0].add_done_callback(lambda _: self.forget(key, call))
+
+        task: Task = call[0]
+        call[1] += 1
+        try:
+            return await shield(task)
+        finally:
+            call[1] -= 1
+            if not call[1] and not task.done():
+                task.cancel()
+
+    def forget(self, key, call: list) -> None:
+        if self.calls.get(key) is call:
+            del self.calls[key]
@@ -5,6 +5,8 @@ class Song():
 
     def __init__(self, id: str, info: dict) -> None:
         self.id = id
+        # Query cache key stored once a song queued unresolved resolves
+        self.query_key = None
         self.from_dict(info)
 
     def to_dict(self) -> dict:
@@ -20,6 +22,8 @@ class Song():
         output['times_played'] = self.times_played
         output['track'] = self.track
         output['artist'] = self.artist
+        output['opus_path'] = self.opus_path
+        output['loudness_gain'] = self.loudness_gain
         return output
 
     def from_dict(self, info: dict) -> None:
@@ -31,11 +35,6 @@ class Song():
                 if thumb['preference'] == 0:
                     thumbnail = thumb['url']
 
-        if 'requester' in info:
-            self.requester = info['requester']
-        else:
-            self.requester = None
-
         if 'added_date' in info:
             self.added_date = info['added_date']
         else:
@@ -58,5 +57,9 @@ class Song():
         self.thumb = thumbnail
         self.track = info.get('track')
         self.artist = info.get('artist')
+        self.opus_path = info.get('opus_path')
+        self.loudness_gain = info.get('loudness_gain')
 
         self.lyrics = None
+        self.stream_url = None
+        self.info = None
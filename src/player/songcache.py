@@ -1,103 +1,302 @@
 from logging import exception
 from src.player.song import Song
-from os import listdir, makedirs, getenv
-from yt_dlp import YoutubeDL
+from os import listdir, makedirs, getenv, path, remove, rename
+from src.player.audio import get_index_path, get_opus_path
+from src.player.youtube import get_info_path, get_song_info, read_song_info
 from src.logger import Logger
 from re import I, match
-from json import dumps, load
+from json import dumps, load, loads
 from datetime import date
+from asyncio import Semaphore, gather, sleep
+from collections import OrderedDict
+from weakref import WeakValueDictionary
+import sqlite3
+
+
+CACHE_TABLE = """
+CREATE TABLE IF NOT EXISTS TB_SONG(
+    ID TEXT NOT NULL PRIMARY KEY,
+    PATH TEXT,
+    TIMES_PLAYED INTEGER NOT NULL DEFAULT 0,
+    LAST_PLAYED TEXT,
+    SIZE INTEGER,
+    DATA TEXT NOT NULL
+);
+"""
+
+
+def media_size(song_path: str) -> int:
+    """
+    Bytes used on disk by the song media and its sidecars
+    """
+    if not song_path:
+        return 0
+    return sum(path.getsize(file_path)
+               for file_path in (song_path, get_opus_path(song_path),
+                                 get_index_path(song_path),
+                                 get_info_path(song_path))
+               if path.exists(file_path))
+
+
+class SongEntry():
+    __slots__ = ('id', 'path', 'size', 'times_played', 'last_played')
+
+    def __init__(self, id: str, path: str, size: int, times_played: int,
+                 last_played: str) -> None:
+        self.id = id
+        self.path = path
+        self.size = size
+        self.times_played = times_played
+        self.last_played = last_played
 
 
 class SongCache():
+    """
+    Song metadata stored on cfg/cache.db, one row per song.
+    Only a compact index (path, size and play stats) stays in memory,
+    full songs are loaded when requested and kept on a bounded LRU,
+    and changed songs are written in batches by the flush loop.
+    A song evicted from the LRU but still referenced (by a queue)
+    keeps being the one instance returned for its id.
+    """
+
+    BACKGROUND_GUILD = 0
+    SIDECARS = ('.opus', '.idx', '.json', '.part')
 
     def __init__(self, logger: Logger) -> None:
         self.logger = logger
         self.logger.info('Inicializando cache.')
         self.songs_path = 'songs'
         self.cfg_path = 'cfg'
-        self.cache = self.load()
-        if not self.cache:
-            self.cache = {}
-        self.map_folder()
-        self.MAX_SIZE = getenv('MAX_CACHE_SIZE', 100)
+        self.pins = {}
+        self.cache = OrderedDict()
+        self.loaded = WeakValueDictionary()
+        self.dirty = {}
+        self.pending_plays = {}
+        self.LRU_SIZE = int(getenv('CACHE_LRU_SIZE', 512))
+        self.FLUSH_INTERVAL = int(getenv('CACHE_FLUSH_INTERVAL', 5))
+        self.RECONCILE_PARALLELISM = int(getenv('RECONCILE_PARALLELISM', 4))
+        makedirs(self.cfg_path, exist_ok=True)
+        self.connection = sqlite3.connect(f'{self.cfg_path}/cache.db')
+        self.connection.execute(CACHE_TABLE)
+        self.index = self.load()
+        self.migrate()
 
     def add_song(self, song: Song) -> None:
-        # if self.queue_size() + 1 < self.MAX_SIZE:
         self.logger.info(f'Adicionando musica {song.id} ao cache.')
+        entry = self.index.get(song.id)
+        if entry and entry.times_played > song.times_played:
+            # A copy loaded before newer plays were counted
+            song.times_played = entry.times_played
+            song.last_played = max(song.last_played or '', entry.last_played or '') or None
+        plays = self.pending_plays.pop(song.id, 0)
+        if plays:
+            song.times_played += plays
+            song.last_played = date.today().strftime("%Y-%m-%d")
+        self.index[song.id] = SongEntry(song.id, song.path, media_size(song.path),
+                                        song.times_played, song.last_played)
+        self.remember(song)
+        self.dirty[song.id] = song
+
+    def remember(self, song: Song) -> None:
+        """
+        Keeps the song on the LRU of loaded songs
+        """
         self.cache[song.id] = song
-        self.save()
-        # else:
-        #    self.logger.warn('Cache cheia.')
-        #    raise NotImplemented('Fazer')
+        self.cache.move_to_end(song.id)
+        self.loaded[song.id] = song
+        while len(self.cache) > self.LRU_SIZE:
+            self.cache.popitem(last=False)
+
+    def remove_song(self, id: str) -> None:
+        """
+        Deletes the song media, its renditions and its record
+        """
+        self.logger.info(f'Removendo musica {id} do cache.')
+        entry = self.index.pop(id, None)
+        song_path = entry.path if entry else None
+        if song_path:
+            for file_path in (song_path, get_opus_path(song_path),
+                              get_index_path(song_path),
+                              get_info_path(song_path)):
+                if path.exists(file_path):
+                    remove(file_path)
+        with self.connection:
+            self.connection.execute('DELETE FROM TB_SONG WHERE ID=?', (id,))
+        self.dirty.pop(id, None)
+        self.cache.pop(id, None)
+        self.loaded.pop(id, None)
+
+    def entries(self) -> list:
+        """
+        Returns the index entry of every song,
+        measuring the ones without a known size
+        """
+        entries = list(self.index.values())
+        for entry in entries:
+            if entry.size is None:
+                entry.size = media_size(entry.path)
+        return entries
+
+    def has_song(self, id: str) -> bool:
+        return id in self.index
+
+    def unmeasured(self) -> list:
+        """
+        Returns the ids of the songs without a loudness measure
+        """
+        cursor = self.connection.execute(
+            "SELECT ID FROM TB_SONG "
+            "WHERE json_extract(DATA, '$.loudness_gain') IS NULL")
+        ids = [row[0] for row in cursor]
+        ids.extend(id for id, song in self.dirty.items()
+                   if song.loudness_gain is None and id not in ids)
+        return ids
+
+    def pin(self, owner: int, ids: list) -> None:
+        """
+        Protects songs from eviction on behalf of an owner
+        """
+        self.pins[owner] = set(ids)
+
+    def unpin(self, owner: int) -> None:
+        self.pins.pop(owner, None)
+
+    def is_pinned(self, id: str) -> bool:
+        return any(id in ids for ids in self.pins.values())
 
     def increment_plays(self, id: str):
-        if id in self.cache:
-            self.cache[id].times_played += 1
-            self.cache[id].last_played = date.today().strftime("%Y-%m-%d")
-        self.save()
+        """
+        Counts a play, songs still downloading
+        have it applied once they are added
+        """
+        song = self.get_song(id)
+        if not song:
+            self.pending_plays[id] = self.pending_plays.get(id, 0) + 1
+        else:
+            song.times_played += 1
+            song.last_played = date.today().strftime("%Y-%m-%d")
+            entry = self.index[id]
+            entry.times_played = song.times_played
+            entry.last_played = song.last_played
+            self.dirty[id] = song
 
     def load(self) -> dict:
         self.logger.info('Buscando cache em disco.')
-        ret = {}
+        cursor = self.connection.execute(
+            'SELECT ID, PATH, SIZE, TIMES_PLAYED, LAST_PLAYED FROM TB_SONG')
+        index = {row[0]: SongEntry(*row) for row in cursor}
+        self.logger.info(f'Cache com {len(index)} musicas.')
+        return index
+
+    def migrate(self) -> None:
+        """
+        Imports the old cache.json into the database once
+        """
+        json_path = f"{self.cfg_path}/cache.json"
+        if not path.exists(json_path):
+            return
         try:
-            makedirs(self.cfg_path, exist_ok=True)
-            with open(f"{self.cfg_path}/cache.json", 'r') as data:
-                self.logger.info('Arquivo de cache encontrado, carregando.')
+            self.logger.info('Migrando cache.json para o banco de dados.')
+            with open(json_path, 'r') as data:
                 tmp = load(data)
-                for i in tmp:
-                    ret[tmp[i]['id']] = Song(tmp[i]['id'], tmp[i])
-                self.logger.info('Cache carregado com sucesso.')
-            return ret
-        except FileNotFoundError as e:
-            self.logger.warn(f'Arquivo de cache não encontrado [{e}]')
-            return None
+            for i in tmp:
+                if not self.has_song(tmp[i]['id']):
+                    self.add_song(Song(tmp[i]['id'], tmp[i]))
+            self.save()
+            rename(json_path, f'{json_path}.bak')
+            self.logger.info('Migracao do cache concluida.')
         except Exception as e:
-            self.logger.error(f'Erro ao carregar arquivo de cache [{e}]')
-            return None
+            self.logger.error(f'Erro ao migrar arquivo de cache [{e}]')
 
     def save(self) -> None:
+        """
+        Writes the changed songs in a single transaction
+        """
+        dirty, self.dirty = self.dirty, {}
+        rows = [self.to_row(song) for song in dirty.values()]
+        if not rows:
+            return
         try:
-            makedirs(self.cfg_path, exist_ok=True)
-            with open(f"{self.cfg_path}/cache.json", 'w') as out:
-                out.write(self.to_json())
-            self.logger.info('Cache salvo em disco.')
+            with self.connection:
+                self.connection.executemany(
+                    'INSERT OR REPLACE INTO TB_SONG'
+                    '(ID, PATH, TIMES_PLAYED, LAST_PLAYED, SIZE, DATA) '
+                    'VALUES(?, ?, ?, ?, ?, ?)', rows)
+            self.logger.info(f'{len(rows)} musicas salvas no cache.')
         except Exception as e:
-            self.logger.critical(f'Erro ao salvar arquivo de cache [{e}]')
+            self.dirty = {**dirty, **self.dirty}
+            self.logger.critical(f'Erro ao salvar cache [{e}]')
+
+    async def run(self) -> None:
+        """
+        Flushes the changed songs every interval
+        """
+        while True:
+            await sleep(self.FLUSH_INTERVAL)
+            self.save()
 
     def get_song(self, id: str) -> Song:
-        song = self.cache.get(id)
+        song = self.cache.get(id) or self.dirty.get(id) or self.loaded.get(id)
+        if not song and id in self.index:
+            row = self.connection.execute('SELECT DATA FROM TB_SONG WHERE ID=?',
+                                          (id,)).fetchone()
+            if row:
+                song = Song(id, loads(row[0]))
+        if song:
+            self.remember(song)
         return song
 
     def queue_size(self) -> int:
-        return len(self.cache)
-
-    def to_json(self) -> str:
-        output = {}
-        for song in self.cache:
-            tmp = self.cache[song].to_dict()
-            output[tmp['id']] = tmp
-        return dumps(output, indent=4)
+        return len(self.index)
 
-    def map_folder(self) -> None:
-        self.logger.info('Mapping songs from folder')
-        f = []
+    def to_row(self, song: Song) -> tuple:
+        entry = self.index.get(song.id)
+        return (song.id, song.path, song.times_played, song.last_played,
+                entry.size if entry else None,
+                dumps(song.to_dict(), separators=(',', ':')))
 
+    async def map_folder(self, worker) -> None:
+        """
+        Adds the files of the songs folder missing from the cache,
+        reading the info written at download time before asking youtube
+        """
         makedirs(self.songs_path, exist_ok=True)
-        files = listdir(self.songs_path)
-        for f in files:
+        missing = {}
+        for f in listdir(self.songs_path):
+            if f.endswith(self.SIDECARS):
+                continue
             id = str(match(r'(.*)\..*', f).group(1))
-            url = 'https://www.youtube.com/watch?v=' + id
-            if id not in self.cache:
-                self.logger.info(
-                    f'Musica {id} nao consta no cache, baixando informacoes.')
-                yt = YoutubeDL()
-                song_info = yt.extract_info(url, download=False)
-                song_info[
-                    'path'] = f'{self.songs_path}/{song_info["id"]}.{song_info["ext"]}'
-                song_info['url'] = url
-
-                new_song = Song(song_info['id'], song_info)
-
-                self.cache[song_info['id']] = new_song
-                self.logger.info(f'Musica {id} adicionada no cache')
+            if not self.has_song(id):
+                missing[id] = f'{self.songs_path}/{f}'
+        if not missing:
+            return
+        self.logger.info(
+            f'{len(missing)} musicas nao constam no cache, reconciliando.')
+
+        semaphore = Semaphore(self.RECONCILE_PARALLELISM)
+        done = 0
+
+        async def reconcile(id: str, song_path: str) -> None:
+            nonlocal done
+            async with semaphore:
+                song = read_song_info(song_path)
+                if not song:
+                    url = 'https://www.youtube.com/watch?v=' + id
+                    song = await worker.run(self.BACKGROUND_GUILD, get_song_info,
+                                            self.songs_path, url,
+                                            background=True)
+                if song:
+                    song.path = song_path
+                    song.stream_url = None
+                    song.info = None
+                    opus_path = get_opus_path(song_path)
+                    song.opus_path = opus_path if path.exists(opus_path) else None
+                    self.add_song(song)
+                done += 1
+                if done % 20 == 0 or done == len(missing):
+                    self.logger.info(f'Reconciliacao do cache: {done}/{len(missing)}.')
+
+        await gather(*(reconcile(id, song_path)
+                       for id, song_path in missing.items()))
         self.save()
@@ -0,0 +1,148 @@
+from asyncio import Event
+from random import random, shuffle
+
+
+class Node():
+    __slots__ = ('value', 'next', 'width')
+
+    def __init__(self, value, level: int) -> None:
+        self.value = value
+        self.next = [None] * level
+        self.width = [1] * level
+
+
+class SongQueue():
+    """
+    Guild queue backed by an indexable skiplist:
+    get, remove and insert by position in O(log n),
+    with a running total of the queued duration
+    and an awaitable "item available" event.
+    """
+
+    MAX_LEVEL = 16
+
+    def __init__(self) -> None:
+        self.not_empty = Event()
+        self.clear()
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __iter__(self):
+        node = self.head.next[0]
+        while node:
+            yield node.value
+            node = node.next[0]
+
+    def empty(self) -> bool:
+        return self.size == 0
+
+    def qsize(self) -> int:
+        return self.size
+
+    def put(self, song) -> None:
+        self.insert(self.size, song)
+
+    def get(self):
+        return self.remove(0)
+
+    def peek(self):
+        """
+        Returns the first song without removing it
+        """
+        node = self.head.next[0]
+        return node.value if node else None
+
+    async def wait(self) -> None:
+        """
+        Waits until there is a song on the queue
+        """
+        await self.not_empty.wait()
+
+    def find(self, index: int) -> tuple:
+        """
+        Returns the last node before the index on every level
+        and their positions
+        """
+        update = [None] * self.MAX_LEVEL
+        steps = [0] * self.MAX_LEVEL
+        node, pos = self.head, -1
+        for level in reversed(range(self.MAX_LEVEL)):
+            while node.next[level] and pos + node.width[level] < index:
+                pos += node.width[level]
+                node = node.next[level]
+            update[level] = node
+            steps[level] = pos
+        return update, steps
+
+    def insert(self, index: int, song) -> None:
+        if not 0 <= index <= self.size:
+            raise IndexError('queue index out of range')
+        level = 1
+        while level < self.MAX_LEVEL and random() < 0.5:
+            level += 1
+
+        update, steps = self.find(index)
+        node = Node(song, level)
+        for lvl in range(level):
+            prev = update[lvl]
+            node.next[lvl] = prev.next[lvl]
+            prev.next[lvl] = node
+            node.width[lvl] = prev.width[lvl] - (index - steps[lvl]) + 1
+            prev.width[lvl] = index - steps[lvl]
+        for lvl in range(level, self.MAX_LEVEL):
+            update[lvl].width[lvl] += 1
+
+        self.size += 1
+        self.duration += song.duration or 0
+        self.not_empty.set()
+
+    def remove(self, index: int):
+        if not 0 <= index < self.size:
+            raise IndexError('queue index out of range')
+        update, _ = self.find(index)
+        node = update[0].next[0]
+        for lvl in range(self.MAX_LEVEL):
+            prev = update[lvl]
+            if prev.next[lvl] is node:
+                prev.width[lvl] += node.width[lvl] - 1
+                prev.next[lvl] = node.next[lvl]
+            else:
+                prev.width[lvl] -= 1
+
+        self.size -= 1
+        self.duration -= node.value.duration or 0
+        if not self.size:
+            self.not_empty.clear()
+        return node.value
+
+    def move(self, src: int, dst: int) -> None:
+        self.insert(dst, self.remove(src))
+
+    def slice(self, start: int, stop: int) -> list:
+        """
+        Returns the songs between two positions
+        """
+        start, stop = max(start, 0), min(stop, self.size)
+        if start >= stop:
+            return []
+        update, _ = self.find(start)
+        node = update[0].next[0]
+        songs = []
+        for _ in range(stop - start):
+            songs.append(node.value)
+            node = node.next[0]
+        return songs
+
+    def clear(self) -> None:
+        self.head = Node(None, self.MAX_LEVEL)
+        self.size = 0
+        self.duration = 0
+        self.not_empty.clear()
+
+    def shuffle(self) -> None:
+        songs = list(self)
+        shuffle(songs)
+        self.clear()
+        for song in songs:
+            self.put(song)
@@ -0,0 +1,100 @@
+from json import loads
+from os import getenv
+from re import search
+from time import time
+from typing import AsyncIterator
+
+from aiohttp import BasicAuth
+
+from src.logger import Logger
+from src.player.http import HttpClient
+
+
+SPOTIFY_COLLECTION = r"https:\/\/open\.spotify\.com\/(?:intl-[\w-]+\/)?(playlist|album)\/(\w{22})"
+TOKEN_URL = 'https://accounts.spotify.com/api/token'
+API_URL = 'https://api.spotify.com/v1'
+EMBED_URL = 'https://open.spotify.com/embed'
+
+
+class Spotify():
+    """
+    Expands spotify playlists and albums into
+    (track id, search query, duration in seconds) tuples,
+    through the web api when credentials are configured,
+    otherwise from the tracks listed on the embed page.
+    """
+
+    def __init__(self, logger: Logger, http: HttpClient) -> None:
+        self.logger = logger
+        self.http = http
+        self.CLIENT_ID = getenv('SPOTIFY_CLIENT_ID')
+        self.CLIENT_SECRET = getenv('SPOTIFY_CLIENT_SECRET')
+        self.token = None
+        self.token_expires = 0
+
+    async def get_token(self) -> str:
+        if not self.token or self.token_expires < time():
+            data = await self.http.get_json(
+                TOKEN_URL, method='POST',
+                data={'grant_type': 'client_credentials'},
+                auth=BasicAuth(self.CLIENT_ID, self.CLIENT_SECRET))
+            self.token = data['access_token']
+            self.token_expires = time() + data.get('expires_in', 3600) - 60
+        return self.token
+
+    async def iter_tracks(self, url: str) -> AsyncIterator[tuple]:
+        kind, id = search(SPOTIFY_COLLECTION, url).groups()
+        if self.CLIENT_ID and self.CLIENT_SECRET:
+            tracks = self.iter_api_tracks(kind, id)
+        else:
+            tracks = self.iter_embed_tracks(kind, id)
+        async for track in tracks:
+            yield track
+
+    async def iter_api_tracks(self, kind: str, id: str) -> AsyncIterator[tuple]:
+        """
+        Follows the pages of the playlist or album tracks on the web api
+        """
+        next_url = f'{API_URL}/{kind}s/{id}/tracks?limit=50'
+        while next_url:
+            token = await self.get_token()
+            data = await self.http.get_json(
+                next_url, headers={'Authorization': f'Bearer {token}'})
+            for item in data.get('items', []):
+                track = item.get('track', item) if kind == 'playlist' else item
+                if track and track.get('id'):
+                    artists = ' '.join(artist['name'] for artist in track.get('artists', []))
+                    duration = track.get('duration_ms')
+                    yield (track['id'], f"{track['name']} {artists}",
+                           duration // 1000 if duration else None)
+            next_url = data.get('next')
+
+    async def iter_embed_tracks(self, kind: str, id: str) -> AsyncIterator[tuple]:
+        """
+        Reads the track list embedded on the player page,
+        limited to the tracks spotify shows there
+        """
+        html = await self.http.get_text(f'{EMBED_URL}/{kind}/{id}')
+        data = search(r'<script id="__NEXT_DATA__" type="application/json">(.*?)</script>',
+                      html)
+        if not data:
+            raise Exception(f'Failed to get tracks from spotify {kind} {id}')
+        for track in self.find_tracks(loads(data.group(1))):
+            yield track
+
+    def find_tracks(self, node) -> list:
+        tracks = []
+        if isinstance(node, dict):
+            uri = node.get('uri')
+            if isinstance(uri, str) and uri.startswith('spotify:track:') and node.get('title'):
+                duration = node.get('duration')
+                tracks.append((uri.rsplit(':', 1)[1],
+                               f"{node['title']} {node.get('subtitle', '')}".strip(),
+                               duration // 1000 if isinstance(duration, int) else None))
+            else:
+                for value in node.values():
+                    tracks += self.find_tracks(value)
+        elif isinstance(node, list):
+            for value in node:
+                tracks += self.find_tracks(value)
+        return list(dict.fromkeys(tracks))
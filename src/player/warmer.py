@@ -0,0 +1,115 @@
+from asyncio import sleep
+from collections import defaultdict
+from datetime import datetime, timedelta
+from os import getenv
+
+from src.db.bot_sql import EVENT_TYPES
+from src.logger import Logger
+from src.player.evictor import Evictor
+from src.player.prefetcher import Prefetcher
+from src.player.songcache import SongCache
+from src.player.worker import Worker
+from src.player.youtube import get_song_info
+
+
+class Warmer():
+    """
+    Background job that, during quiet hours, downloads the most played
+    and the trending songs of each guild from the MUSIC_PLAY history,
+    so they are on disk before the next peak.
+    """
+
+    BACKGROUND_GUILD = 0
+
+    def __init__(self, logger: Logger, bot, cache: SongCache, worker: Worker,
+                 prefetcher: Prefetcher, evictor: Evictor) -> None:
+        self.logger = logger
+        self.bot = bot
+        self.cache = cache
+        self.worker = worker
+        self.prefetcher = prefetcher
+        self.evictor = evictor
+        self.QUIET_HOURS = [int(hour) for hour in getenv('WARMUP_HOURS', '3-7').split('-')]
+        self.SIZE = int(getenv('WARMUP_SIZE', 10))
+        self.TRENDING_DAYS = int(getenv('WARMUP_TRENDING_DAYS', 7))
+        self.INTERVAL = 1800
+        self.last_run = None
+
+    def is_quiet(self, now: datetime) -> bool:
+        start, end = self.QUIET_HOURS
+        if start <= end:
+            return start <= now.hour < end
+        return now.hour >= start or now.hour < end
+
+    async def run(self) -> None:
+        while True:
+            now = datetime.now()
+            if self.is_quiet(now) and self.last_run != now.date():
+                self.last_run = now.date()
+                try:
+                    await self.warm()
+                except Exception as e:
+                    self.logger.error(f'Erro ao pre-carregar musicas populares [{e}]')
+            await sleep(self.INTERVAL)
+
+    def popular(self, now: datetime) -> dict:
+        """
+        Returns, by guild, the most played songs
+        followed by the most played in the last days
+        """
+        since = now - timedelta(days=self.TRENDING_DAYS)
+        total = self.most_played()
+        trending = self.most_played(
+            # DH_EVENT is stored as dd/mm/yyyy hh:mm:ss
+            "AND substr(DH_EVENT, 7, 4) || '-' || substr(DH_EVENT, 4, 2) || '-' "
+            "|| substr(DH_EVENT, 1, 2) || substr(DH_EVENT, 11) >= ? ",
+            (since.strftime("%Y-%m-%d %H:%M:%S"),))
+
+        popular = {}
+        for guild_id, ids in total.items():
+            ids = ids + trending.get(guild_id, [])
+            popular[guild_id] = list(dict.fromkeys(ids))[:self.SIZE * 2]
+        return popular
+
+    def most_played(self, where: str = "", args: tuple = ()) -> dict:
+        """
+        Returns, by guild, the ids of the most played songs
+        """
+        rows = self.bot.db.fetch_result(
+            "SELECT ID_GUILD, DS_EVENT FROM TB_EVENTS "
+            "WHERE ID_EVENT_TYPE=? AND DS_EVENT IS NOT NULL AND DS_EVENT<>'None' "
+            f"{where}"
+            "GROUP BY ID_GUILD, DS_EVENT ORDER BY ID_GUILD, COUNT(*) DESC",
+            (EVENT_TYPES.MUSIC_PLAY.value,) + args) or []
+        played = defaultdict(list)
+        for guild_id, song_id in rows:
+            if len(played[guild_id]) < self.SIZE:
+                played[guild_id].append(song_id)
+        return played
+
+    async def warm(self) -> None:
+        popular = self.popular(datetime.now())
+        ids = list(dict.fromkeys(id for ids in popular.values() for id in ids))
+        self.logger.info(f'Pre-carregando ate {len(ids)} musicas populares.')
+        warmed = 0
+        for id in ids:
+            song = self.cache.get_song(id)
+            if song and self.prefetcher.is_ready(song):
+                continue
+            if not song and not self.evictor.has_room():
+                self.logger.info('Cache sem espaco, pre-carregamento interrompido.')
+                break
+            if not song:
+                url = 'https://www.youtube.com/watch?v=' + id
+                song = await self.worker.run(self.BACKGROUND_GUILD, get_song_info,
+                                             self.cache.songs_path, url,
+                                             background=True)
+                if not song:
+                    continue
+                self.prefetcher.keep_info(song)
+            self.prefetcher.start_download(song, self.BACKGROUND_GUILD)
+            task = self.prefetcher.downloads.get(song.id)
+            if task:
+                await task
+            warmed += 1
+        self.logger.info(f'{warmed} musicas populares pre-carregadas.')
@@ -0,0 +1,103 @@
+from asyncio import get_running_loop, wrap_future
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from os import getenv
+
+from src.logger import Logger
+
+
+class Worker():
+    """
+    Runs the blocking yt-dlp and ffmpeg calls outside the event loop.
+    Jobs are dispatched round-robin between guilds, with a global
+    cap of workers and a cap of running jobs per guild.
+    Background jobs (prefetch, analysis, warmup) have their own lane,
+    started only when no interactive job is waiting and capped
+    below the pool size, so requests never queue behind them.
+    """
+
+    def __init__(self, logger: Logger) -> None:
+        self.logger = logger
+        self.MAX_WORKERS = int(getenv('WORKER_POOL_SIZE', 8))
+        self.GUILD_LIMIT = int(getenv('WORKER_GUILD_LIMIT', 4))
+        self.BACKGROUND_LIMIT = int(getenv('WORKER_BACKGROUND_LIMIT',
+                                           max(1, self.MAX_WORKERS // 2)))
+        if getenv('WORKER_POOL_TYPE', 'thread') == 'process':
+            self.executor = ProcessPoolExecutor(max_workers=self.MAX_WORKERS)
+        else:
+            self.executor = ThreadPoolExecutor(
+                max_workers=self.MAX_WORKERS, thread_name_prefix='worker')
+        self.pending = OrderedDict()
+        self.running = Counter()
+        self.background_pending = OrderedDict()
+        self.background_running = Counter()
+        self.logger.info(
+            f'Pool de workers iniciado com {self.MAX_WORKERS} workers.')
+
+    async def run(self, guild_id: int, func, *args, background=False):
+        """
+        Schedules a blocking function for a guild
+        and waits for its result
+        """
+        future = get_running_loop().create_future()
+        pending = self.background_pending if background else self.pending
+        pending.setdefault(guild_id, deque()).append((future, func, args))
+        self.dispatch()
+        return await future
+
+    def dispatch(self) -> None:
+        """
+        Starts pending jobs while there are free workers,
+        one guild at a time, interactive jobs first
+        """
+        while sum(self.running.values()) + \
+                sum(self.background_running.values()) < self.MAX_WORKERS:
+            if self.start(self.pending, self.running):
+                continue
+            if sum(self.background_running.values()) >= self.BACKGROUND_LIMIT \
+                    or not self.start(self.background_pending,
+                                      self.background_running):
+                return
+
+    def start(self, pending: OrderedDict, running: Counter) -> bool:
+        """
+        Starts the next job of a lane
+        Return False if no guild of the lane can run one
+        """
+        guild_id = next((g for g in pending
+                         if running[g] < self.GUILD_LIMIT), None)
+        if guild_id is None:
+            return False
+
+        jobs = pending[guild_id]
+        future, func, args = jobs.popleft()
+        if jobs:
+            pending.move_to_end(guild_id)
+        else:
+            del pending[guild_id]
+        if future.cancelled():
+            return True
+
+        running[guild_id] += 1
+        job = wrap_future(self.executor.submit(func, *args))
+        job.add_done_callback(
+            lambda job, future=future, guild_id=guild_id: self.done(
+                job, future, guild_id, running))
+        return True
+
+    def done(self, job, future, guild_id: int, running: Counter) -> None:
+        running[guild_id] -= 1
+        if running[guild_id] <= 0:
+            del running[guild_id]
+        if future.cancelled():
+            pass
+        elif job.cancelled():
+            future.cancel()
+        elif job.exception():
+            future.set_exception(job.exception())
+        else:
+            future.set_result(job.result())
+        self.dispatch()
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -1,75 +1,173 @@
+from contextlib import contextmanager
+from json import dumps, load
 from logging import exception
-from typing import Dict, List
-from discord.member import Member
+from os import path
+from threading import Lock
+from time import time
+from typing import AsyncIterator, Dict
 import yt_dlp
-import urllib.request
+import urllib.parse
 import re
+from src.player.http import HttpClient
 from src.player.song import Song
 
 
-def download_song(folder: str, url: str, requester: Member) -> Song:
+ydl_pool = {}
+ydl_pool_lock = Lock()
+
+
+@contextmanager
+def youtube_dl(folder: str):
     """
-        Download a video from youtube
-        Return a Song class with the music data
+        Borrow a warm YoutubeDL instance that saves to the folder,
+        creating one when all of them are in use
     """
-    ydl_opts = {
-        'format': 'bestaudio/best',
-        'outtmpl': f'{folder}/%(id)s.%(ext)s',
-        # 'ratelimit': 10240, #limit download ratio (bytes)
-    }
+    with ydl_pool_lock:
+        idle = ydl_pool.setdefault(folder, [])
+        ydl = idle.pop() if idle else None
+    if ydl is None:
+        ydl = yt_dlp.YoutubeDL({
+            'format': 'bestaudio/best',
+            'outtmpl': f'{folder}/%(id)s.%(ext)s',
+            # 'ratelimit': 10240, #limit download ratio (bytes)
+        })
     try:
-        ydl = yt_dlp.YoutubeDL(ydl_opts)
-        song_info = ydl.extract_info(url, download=False)
-        song_info['path'] = f'{folder}/{song_info["id"]}.{song_info["ext"]}'
-        song_info['url'] = url
+        yield ydl
+    finally:
+        with ydl_pool_lock:
+            idle.append(ydl)
 
-        new_song = Song(song_info['id'], song_info)
 
-        ydl.download([url])
+def download_song(folder: str, url: str) -> Song:
+    """
+        Download a video from youtube in a single extraction
+        Return a Song class with the music data
+    """
+    try:
+        with youtube_dl(folder) as ydl:
+            song_info = ydl.extract_info(url, download=True)
+            song_path = ydl.prepare_filename(song_info)
+
+        new_song = Song(song_info['id'], {**song_info, 'path': song_path, 'url': url})
+        write_song_info(new_song)
         return new_song
     except Exception as err:
         print(f'[ERROR] - Failed to download song url: {url}\n Err:{err}')
 
 
-def get_song_url(song: str) -> str:
+def get_song_info(folder: str, url: str) -> Song:
+    """
+        Resolve a video from youtube without downloading it
+        Return a Song class with the music data and its stream url
+    """
+    try:
+        with youtube_dl(folder) as ydl:
+            song_info = ydl.extract_info(url, download=False)
+            song_path = ydl.prepare_filename(song_info)
+
+        new_song = Song(song_info['id'], {**song_info, 'path': song_path, 'url': url})
+        new_song.stream_url = song_info.get('url')
+        new_song.info = song_info
+        return new_song
+    except Exception as err:
+        print(f'[ERROR] - Failed to resolve song url: {url}\n Err:{err}')
+
+
+def is_stream_expired(stream_url: str) -> bool:
+    """
+        Checks if a stream url is missing
+        or close to the expire time youtube signs into it
+    """
+    if not stream_url:
+        return True
+    expire = re.search(r'[?&]expire=(\d+)', stream_url)
+    return bool(expire) and int(expire.group(1)) < time() + 60
+
+
+def fetch_song(song: Song, info: dict = None) -> bool:
+    """
+        Download the media of an already resolved song
+        to its path on disk, reusing its extracted info when given
+    """
+    try:
+        with youtube_dl(path.dirname(song.path)) as ydl:
+            if info:
+                ydl.process_ie_result(info, download=True)
+            else:
+                ydl.download([song.url])
+        write_song_info(song)
+        return True
+    except Exception as err:
+        print(f'[ERROR] - Failed to download song url: {song.url}\n Err:{err}')
+        return False
+
+
+def get_info_path(song_path: str) -> str:
+    return song_path.rsplit('.', 1)[0] + '.info.json'
+
+
+def write_song_info(song: Song) -> None:
+    """
+        Write the song metadata next to its media,
+        so the cache can be rebuilt without asking youtube
+    """
+    try:
+        with open(get_info_path(song.path), 'w') as out:
+            out.write(dumps(song.to_dict()))
+    except Exception as err:
+        print(f'[ERROR] - Failed to write song info: {song.id}\n Err:{err}')
+
+
+def read_song_info(song_path: str) -> Song:
+    """
+        Read the metadata written at download time
+        Return None if there is none
+    """
+    try:
+        with open(get_info_path(song_path), 'r') as data:
+            info = load(data)
+        return Song(info['id'], info)
+    except Exception:
+        return None
+
+
+async def get_song_url(http: HttpClient, song: str) -> str:
     """
         Search for a song on youtube
         and return its url
     """
     is_spotify_url = re.match(r"https:\/\/open\.spotify\.com\/track\/.*", song)
     if is_spotify_url:
-        return get_song_url_from_spotify(song)
+        return await get_song_url_from_spotify(http, song)
     else:
-        return get_song_youtube_url(song)
+        return await get_song_youtube_url(http, song)
 
 
-def get_song_youtube_url(song_query: str) -> str:
+async def get_song_youtube_url(http: HttpClient, song_query: str) -> str:
     """
         Search for a song query on youtube
         and return its url
     """
     try:
         song_query = urllib.parse.quote_plus(song_query)
-        html = urllib.request.urlopen(
-            f"https://www.youtube.com/results?search_query={song_query}")
-        video_ids = re.findall(r"watch\?v=(\S{11})", html.read().decode())
+        video_ids = await http.scan(
+            f"https://www.youtube.com/results?search_query={song_query}",
+            r"watch\?v=(\S{11})", limit=1)
         return f'https://www.youtube.com/watch?v={video_ids[0]}'
     except:
         raise Exception(f'Failed to get video url to the song "{song_query}"')
 
 
-def get_song_url_from_spotify(url: str) -> str:
+async def get_song_url_from_spotify(http: HttpClient, url: str) -> str:
     """
         Search for song on on youtube
         by a spotify track url
         and return its url
     """
     try:
-        html = urllib.request.urlopen(url)
-        html_decoded = html.read().decode()
-        song_info = re.findall(r"<h1.*>.*<span.*>(.*)</span.*></h1>",
-                               html_decoded)
-        song_url = get_song_youtube_url(f'{song_info[0]} {song_info[1]}')
+        song_info = await http.scan(url, r"<h1.*>.*<span.*>(.*)</span.*></h1>",
+                                    limit=2)
+        song_url = await get_song_youtube_url(http, f'{song_info[0]} {song_info[1]}')
         return song_url
     except:
         raise Exception(
@@ -77,22 +175,52 @@ def get_song_url_from_spotify(url: str) -> str:
         )
 
 
-def get_youtube_playlist_songlist(url: str) -> List[str]:
+PLAYLIST_PATTERN = (
+    r'"playlistVideoRenderer":\s*\{\s*"videoId":\s*"(?P<video>[\w-]{11})"'
+    r'|"continuationCommand":\s*\{\s*"token":\s*"(?P<token>[\w%-]+)"'
+    r'|"INNERTUBE_API_KEY":\s*"(?P<key>[\w-]+)"'
+    r'|"INNERTUBE_CLIENT_VERSION":\s*"(?P<version>[\d.]+)"')
+BROWSE_URL = 'https://www.youtube.com/youtubei/v1/browse'
+
+
+async def iter_youtube_playlist(http: HttpClient, url: str) -> AsyncIterator[str]:
     """
-        Returns an array of videos urls
-        from a youtube playlist url
+        Yields the videos urls of a youtube playlist while its pages
+        are downloaded, following the continuation pages
     """
-    try:
-        html = urllib.request.urlopen(url)
-        video_ids = re.findall(r"watch\?v=(\S{11})", html.read().decode())
-        video_ids = list(dict.fromkeys(video_ids))
-        if len(video_ids) > 0:
-            video_urls = []
-            for id in video_ids:
-                video_urls.append(f'https://www.youtube.com/watch?v={id}')
-            return video_urls
-        else:
-            raise Exception(f'No videos ids founded on url {url}')
-    except:
-        raise Exception(
-            f'Failed to get songlist from playlist with url: "{url}"')
+    seen = set()
+    tokens = set()
+    page = {}
+    request = {}
+    while True:
+        token = None
+        async for match in http.iter_matches(url, PLAYLIST_PATTERN, **request):
+            if match.lastgroup == 'video':
+                id = match.group('video')
+                if id not in seen:
+                    seen.add(id)
+                    yield f'https://www.youtube.com/watch?v={id}'
+            elif match.lastgroup == 'token':
+                token = match.group('token')
+            else:
+                page[match.lastgroup] = match.group(match.lastgroup)
+
+        if not seen:
+            break
+        if not token or token in tokens or 'key' not in page:
+            return
+        tokens.add(token)
+        url = f'{BROWSE_URL}?key={page["key"]}'
+        request = {'method': 'POST', 'json': {
+            'context': {'client': {'clientName': 'WEB',
+                                   'clientVersion': page.get('version', '2.20231010.00.00')}},
+            'continuation': token,
+        }}
+
+    # Not a regular playlist page (mixes, channels): take the links on it
+    for id in await http.scan(url, r"watch\?v=([\w-]{11})"):
+        if id not in seen:
+            seen.add(id)
+            yield f'https://www.youtube.com/watch?v={id}'
+    if not seen:
+        raise Exception(f'No videos ids founded on url {url}')
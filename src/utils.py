@@ -3,3 +3,18 @@ def split_str_by_len(str, maxlen) -> list:
     Splits a string in array of strings with a max size
     '''
     return [str[ind:ind + maxlen] for ind in range(0, len(str), maxlen)]
+
+
+def parse_time(text) -> int:
+    '''
+    Converts "ss", "mm:ss" or "hh:mm:ss" to seconds, None if invalid
+    '''
+    seconds = 0
+    parts = text.strip().split(':')
+    if len(parts) > 3:
+        return None
+    for part in parts:
+        if not part.isdigit():
+            return None
+        seconds = seconds * 60 + int(part)
+    return seconds